@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 
-import numpy as np
 import pyautogui
 import time
-import xlrd
 import pyperclip
 import os
 import sys
 import threading
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from rpa_runner import AutomationRunner, PyAutoGuiBackend, ScriptError, load_program
 from openpyxl import Workbook
 from openpyxl.styles import Font
 import tempfile
@@ -24,6 +26,58 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+class LogSink:
+    """
+    日志队列：任何线程都可以写入，由界面线程定时批量取出
+
+    写入只是向 deque 追加一条记录（不加锁、不等待界面），执行线程不会因为刷新日志而变慢。
+    可选写入按大小轮转的日志文件，保留完整的执行记录。
+    """
+
+    def __init__(self):
+        self._records = deque()
+        self._file_logger = None
+        self._file_lock = threading.Lock()  # 取出日志和打开、关闭日志文件互斥，关闭文件时不会丢失日志
+
+    def write(self, message):
+        self._records.append(f"{time.strftime('%H:%M:%S')} - {message}")
+
+    def drain(self):
+        """取出当前积压的全部日志行（同时写入日志文件）"""
+        lines = []
+        records = self._records
+        with self._file_lock:
+            for _ in range(len(records)):
+                lines.append(records.popleft())
+            if lines and self._file_logger is not None:
+                for line in lines:
+                    self._file_logger.info(line)
+        return lines
+
+    def open_file(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5):
+        """开始把日志写入文件，文件超过 max_bytes 时轮转，保留 backup_count 个旧文件"""
+        self.close_file()
+        handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%Y-%m-%d'))
+        logger = logging.getLogger(f"rpa_app.{id(self)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        with self._file_lock:
+            self._file_logger = logger
+
+    def close_file(self):
+        """关闭日志文件；尚未被界面取出的日志先写入文件（之后仍会显示在日志框中）"""
+        with self._file_lock:
+            if self._file_logger is not None:
+                for line in self._records.copy():
+                    self._file_logger.info(line)
+                for handler in list(self._file_logger.handlers):
+                    self._file_logger.removeHandler(handler)
+                    handler.close()
+                self._file_logger = None
+
+
 class RPAApp:
     def __init__(self, root):
         self.root = root
@@ -38,9 +92,19 @@ class RPAApp:
         self.hotkey_enabled = False  # 热键启用状态
         self.stop_hotkey = "ctrl+shift+q"  # 默认停止热键
         self.interval_time = 0.01  # 默认时间间隔
+        self.image_timeout = 1.0  # 单击图片命令（重试次数为1）查找图片的最长时间（秒）
+        self.log_sink = LogSink()  # 日志队列，由界面线程定时刷新到日志框
+        self.max_log_lines = 2000  # 日志框最多保留的行数
+        self.log_flush_interval = 100  # 刷新日志框的间隔（毫秒）
+
+        # 脚本执行器（不依赖界面），模板图片缓存和位置记录在多次执行之间保留
+        backend = PyAutoGuiBackend()
+        self.runner = AutomationRunner(backend, backend, log=self.log, interval_time=self.interval_time,
+                                       image_timeout=self.image_timeout)
 
         # 创建界面
         self.create_widgets()
+        self.root.after(self.log_flush_interval, self.flush_log)
 
     def create_widgets(self):
         # 创建主框架
@@ -96,6 +160,12 @@ class RPAApp:
         interval_help = ttk.Label(interval_frame, text="(默认0.01秒)", foreground="gray")
         interval_help.pack(side=tk.LEFT, padx=5)
 
+        # 单击图片命令（重试次数为1）查找图片的最长时间
+        ttk.Label(interval_frame, text="查找图片最长时间(秒):").pack(side=tk.LEFT, padx=(15, 0))
+        self.image_timeout_var = tk.StringVar(value="1.0")
+        ttk.Entry(interval_frame, textvariable=self.image_timeout_var, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(interval_frame, text="设置时间", command=self.set_image_timeout).pack(side=tk.LEFT, padx=5)
+
         # 停止热键设置
         hotkey_frame = ttk.Frame(main_frame)
         hotkey_frame.grid(row=5, column=0, columnspan=3, pady=10, sticky=tk.W)
@@ -122,6 +192,14 @@ class RPAApp:
 
         # 日志输出
         ttk.Label(main_frame, text="执行日志:").grid(row=7, column=0, sticky=tk.W, pady=(10, 5))
+        log_options = ttk.Frame(main_frame)
+        log_options.grid(row=7, column=1, columnspan=2, sticky=tk.W, pady=(10, 5))
+        self.save_log = tk.BooleanVar(value=False)
+        ttk.Checkbutton(log_options, text="保存完整日志到文件（与 Excel 文件同名的 .log 文件）",
+                        variable=self.save_log).pack(side=tk.LEFT)
+        self.save_profile = tk.BooleanVar(value=False)
+        ttk.Checkbutton(log_options, text="导出耗时统计",
+                        variable=self.save_profile).pack(side=tk.LEFT, padx=(10, 0))
         self.log_text = scrolledtext.ScrolledText(main_frame, width=80, height=20, state=tk.DISABLED)
         self.log_text.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
 
@@ -137,6 +215,18 @@ class RPAApp:
         except ValueError:
             messagebox.showerror("错误", "请输入有效的数字")
 
+    def set_image_timeout(self):
+        """设置单击图片命令查找图片的最长时间"""
+        try:
+            timeout = float(self.image_timeout_var.get().strip())
+            if timeout < 0:
+                messagebox.showerror("错误", "查找时间不能为负数")
+                return
+            self.image_timeout = timeout
+            self.log(f"查找图片最长时间已设置为: {timeout} 秒")
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的数字")
+
     def set_hotkey(self):
         """设置停止热键"""
         new_hotkey = self.hotkey_var.get().strip().lower()
@@ -219,7 +309,7 @@ class RPAApp:
     def browse_file(self):
         filename = filedialog.askopenfilename(
             title="选择 Excel 脚本文件",
-            filetypes=[("Excel files", "*.xls *.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xls *.xlsx"), ("CSV / JSON scripts", "*.csv *.json"), ("All files", "*.*")]
         )
         if filename:
             self.file_path.set(filename)
@@ -269,7 +359,8 @@ class RPAApp:
                 [4, "Hello World", 0, "输入文本"],
                 [6, -100, 0, "向下滚动"],
                 [1, "login.png", 3, "单击登录按钮，最多重试3次 - 请将login.png放在Excel文件同目录下"],
-                [7, "500,300", 1, "单击坐标(500,300) - 使用获取坐标功能获取坐标"]
+                [7, "500,300", 1, "单击坐标(500,300) - 使用获取坐标功能获取坐标"],
+                [8, "dialog.png", 10, "等待dialog.png出现，最多等待10秒（0表示一直等待）"]
             ]
 
             for row, example in enumerate(examples, 2):
@@ -324,331 +415,89 @@ class RPAApp:
         # 注册全局热键
         self.register_hotkey()
 
+        # 按需打开日志文件，保留完整的执行记录
+        if self.save_log.get():
+            log_filename = os.path.splitext(self.file_path.get())[0] + ".log"
+            try:
+                self.log_sink.open_file(log_filename)
+                self.log(f"日志文件: {log_filename}")
+            except OSError as e:
+                self.log(f"无法打开日志文件: {str(e)}")
+        else:
+            self.log_sink.close_file()
+
         self.is_running = True
         self.log("开始执行自动化脚本...")
         self.log(f"停止热键: {self.stop_hotkey} (在循环执行过程中按下可停止程序)")
         self.log(f"操作间隔时间: {self.interval_time} 秒")
+        self.log(f"查找图片最长时间: {self.image_timeout} 秒")
 
-        # 在新线程中执行自动化任务
-        thread = threading.Thread(target=self.execute_automation)
+        # 界面变量只在界面线程中读取，执行线程只拿到普通的值
+        loops = None if self.execution_mode.get() == "1" else loop_count
+        thread = threading.Thread(target=self.execute_automation,
+                                  args=(self.file_path.get(), loops, self.save_profile.get()))
         thread.daemon = True
         thread.start()
 
     def stop_execution(self):
         self.is_running = False
+        self.runner.stop()
         # 取消注册热键
         self.unregister_hotkey()
         self.log("停止执行命令已发送...")
 
-    def execute_automation(self):
+    def execute_automation(self, script_path, loops, save_profile=False):
         try:
-            # 打开 Excel 文件
-            wb = xlrd.open_workbook(self.file_path.get())
-            sheet = wb.sheet_by_index(0)
-
-            # 数据检查
-            if not self.data_check(sheet):
+            # 读取脚本，检查数据并编译为指令列表（脚本未修改时直接使用编译缓存）
+            try:
+                program, cached = load_program(script_path)
+            except ScriptError as e:
+                self.log(str(e))
                 self.log("数据检查未通过，请检查 Excel 文件内容!")
-                self.unregister_hotkey()  # 取消热键注册
                 return
 
+            if cached:
+                self.log("脚本未修改，使用编译缓存")
             self.log("数据检查通过，开始执行脚本...")
-
-            # 获取循环次数
-            loop_count = int(self.loop_count.get())
-
-            # 根据执行模式执行
-            if self.execution_mode.get() == "1":
-                # 执行一次
-                self.main_work(sheet)
-                self.log("执行完成!")
-            else:
-                # 循环执行
-                if loop_count == 0:
-                    # 无限循环
-                    count = 1
-                    while self.is_running:
-                        self.log(f"第 {count} 次循环执行...")
-                        self.main_work(sheet)
-                        time.sleep(self.interval_time)
-                        count += 1
-                else:
-                    # 有限循环
-                    for i in range(loop_count):
-                        if not self.is_running:
-                            break
-                        self.log(f"第 {i + 1} 次循环执行...")
-                        self.main_work(sheet)
-                        time.sleep(self.interval_time)
-
+            self.runner.interval_time = self.interval_time
+            self.runner.image_timeout = self.image_timeout
+            self.runner.profiler.trace = save_profile  # 只在需要导出时保留跟踪事件
+            self.runner.preload(program)
+            if self.is_running:
+                self.runner.run(program, loops=loops)
             self.log("自动化任务执行完毕")
 
+            if save_profile:
+                # 与脚本同名的 .profile.csv（每行命令和各阶段的耗时）和 .trace.json（chrome://tracing）
+                base = os.path.splitext(script_path)[0]
+                self.runner.profiler.save_csv(base + ".profile.csv")
+                self.runner.profiler.save_trace(base + ".trace.json")
+                self.log(f"耗时统计已保存到: {base}.profile.csv，{base}.trace.json")
+
         except Exception as e:
             self.log(f"执行过程中出错: {str(e)}")
         finally:
             self.is_running = False
             self.unregister_hotkey()  # 确保热键被取消注册
-
-    def data_check(self, sheet):
-        try:
-            if sheet.nrows < 2:
-                self.log("Excel 文件中没有数据")
-                return False
-
-            for i in range(1, sheet.nrows):
-                cmd_type = sheet.row(i)[0]
-                if cmd_type.ctype != 2 or cmd_type.value not in [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]:
-                    self.log(f'第 {i + 1} 行, 第1列数据有误')
-                    return False
-
-                cmd_value = sheet.row(i)[1]
-                if cmd_type.value in [1.0, 2.0, 3.0]:
-                    if cmd_value.ctype != 1:
-                        self.log(f'第 {i + 1} 行, 第2列数据有误')
-                        return False
-                elif cmd_type.value == 4.0:
-                    if cmd_value.ctype == 0:
-                        self.log(f'第 {i + 1} 行, 第2列数据有误')
-                        return False
-                elif cmd_type.value == 5.0:
-                    if cmd_value.ctype != 2:
-                        self.log(f'第 {i + 1} 行, 第2列数据有误')
-                        return False
-                elif cmd_type.value == 6.0:
-                    if cmd_value.ctype != 2:
-                        self.log(f'第 {i + 1} 行, 第2列数据有误')
-                        return False
-                elif cmd_type.value == 7.0:  # 坐标点击
-                    if cmd_value.ctype != 1:
-                        self.log(f'第 {i + 1} 行, 第2列数据有误')
-                        return False
-                    # 检查坐标格式
-                    try:
-                        coords = cmd_value.value.split(';')
-                        if len(coords) != 2:
-                            self.log(f'第 {i + 1} 行, 坐标格式错误，应为"x;y"')
-                            return False
-                        x, y = int(coords[0]), int(coords[1])
-                    except ValueError:
-                        self.log(f'第 {i + 1} 行, 坐标格式错误，应为"x;y"')
-                        return False
-
-            return True
-        except Exception as e:
-            self.log(f"数据检查出错: {str(e)}")
-            return False
-
-    def main_work(self, sheet):
-        for i in range(1, sheet.nrows):
-            if not self.is_running:
-                break
-
-            try:
-                cmd_type = sheet.row(i)[0]
-                if cmd_type.value == 1.0:
-                    img = sheet.row(i)[1].value
-                    reTry = 1
-                    if sheet.row(i)[2].ctype == 2 and sheet.row(i)[2].value != 0:
-                        reTry = sheet.row(i)[2].value
-                    success = self.mouse_click(1, "left", img, reTry)
-                    if success:
-                        self.log(f"单击左键: {img}")
-                    else:
-                        self.log(f"跳过第 {i + 1} 行命令：单击左键 {img}")
-
-                elif cmd_type.value == 2.0:
-                    img = sheet.row(i)[1].value
-                    reTry = 1
-                    if sheet.row(i)[2].ctype == 2 and sheet.row(i)[2].value != 0:
-                        reTry = sheet.row(i)[2].value
-                    success = self.mouse_click(2, "left", img, reTry)
-                    if success:
-                        self.log(f"双击左键: {img}")
-                    else:
-                        self.log(f"跳过第 {i + 1} 行命令：双击左键 {img}")
-
-                elif cmd_type.value == 3.0:
-                    img = sheet.row(i)[1].value
-                    reTry = 1
-                    if sheet.row(i)[2].ctype == 2 and sheet.row(i)[2].value != 0:
-                        reTry = sheet.row(i)[2].value
-                    success = self.mouse_click(1, "right", img, reTry)
-                    if success:
-                        self.log(f"右键: {img}")
-                    else:
-                        self.log(f"跳过第 {i + 1} 行命令：右键 {img}")
-
-                elif cmd_type.value == 4.0:
-                    input_value = sheet.row(i)[1].value
-                    pyperclip.copy(input_value)
-                    pyautogui.hotkey('ctrl', 'v')
-                    time.sleep(0.5)
-                    self.log(f"输入: {input_value}")
-
-                elif cmd_type.value == 5.0:
-                    wait_time = sheet.row(i)[1].value
-                    time.sleep(wait_time)
-                    self.log(f"等待 {wait_time} 秒")
-
-                elif cmd_type.value == 6.0:
-                    scroll = sheet.row(i)[1].value
-                    pyautogui.scroll(int(scroll))
-                    self.log(f"滚轮滑动 {int(scroll)} 距离")
-
-                elif cmd_type.value == 7.0:  # 坐标点击
-                    coord_str = sheet.row(i)[1].value
-                    reTry = 1
-                    if sheet.row(i)[2].ctype == 2 and sheet.row(i)[2].value != 0:
-                        reTry = sheet.row(i)[2].value
-                    success = self.coordinate_click(coord_str, reTry)
-                    if success:
-                        self.log(f"坐标点击: {coord_str}")
-                    else:
-                        self.log(f"跳过第 {i + 1} 行命令：坐标点击 {coord_str}")
-
-            except Exception as e:
-                self.log(f"执行第 {i + 1} 行命令时发生错误: {str(e)}，跳过此命令")
-
-    def mouse_click(self, click_times, l_or_r, img, retry):
-        # 解析图片路径
-        img_path = self.resolve_image_path(img)
-
-        # 检查图片文件是否存在
-        if not os.path.exists(img_path):
-            self.log(f"错误：图片文件 '{img}' 不存在（尝试路径: {img_path}）")
-            return False
-
-        self.log(f"正在查找图片: {img_path}")
-
-        if retry == 1:
-            attempt = 0
-            while attempt < 3:  # 最多尝试3次
-                try:
-                    location = pyautogui.locateCenterOnScreen(img_path, confidence=0.8)
-                    if location is not None:
-                        self.log(f"找到图片，位置: {location}")
-                        pyautogui.click(location.x, location.y, clicks=click_times,
-                                        interval=0.2, duration=0.2, button=l_or_r)
-                        return True
-                except pyautogui.ImageNotFoundException:
-                    pass
-
-                attempt += 1
-                time.sleep(self.interval_time)
-
-            self.log(f"未找到匹配图片 '{img}'，跳过此命令")
-            return False
-
-        elif retry == -1:
-            while self.is_running:
-                try:
-                    location = pyautogui.locateCenterOnScreen(img_path, confidence=0.8)
-                    if location is not None:
-                        pyautogui.click(location.x, location.y, clicks=click_times,
-                                        interval=0.2, duration=0.2, button=l_or_r)
-                except pyautogui.ImageNotFoundException:
-                    pass
-                time.sleep(self.interval_time)
-            return True
-
-        elif retry > 1:
-            i = 1
-            while i < retry + 1 and self.is_running:
-                try:
-                    i += 1
-                    location = pyautogui.locateCenterOnScreen(img_path, confidence=0.8)
-                    if location is not None:
-                        pyautogui.click(location.x, location.y, clicks=click_times,
-                                        interval=0.2, duration=0.2, button=l_or_r)
-                        self.log(f"重复执行第 {i-1} 次")
-                except pyautogui.ImageNotFoundException:
-                    self.log(f"第 {i-1} 次尝试未找到图片，继续重试")
-                time.sleep(self.interval_time)
-            return True
-        return True
-
-    def coordinate_click(self, coord_str, retry):
-        """根据坐标进行点击"""
-        try:
-            # 解析坐标
-            coords = coord_str.split(';')
-            if len(coords) != 2:
-                self.log(f"坐标格式错误: {coord_str}")
-                return False
-
-            x, y = int(coords[0]), int(coords[1])
-
-            # 执行点击
-            if retry == 1:
-                pyautogui.click(x, y)
-                return True
-            elif retry > 1:
-                i = 1
-                while i <= retry and self.is_running:
-                    i += 1
-                    pyautogui.click(x, y)
-                    self.log(f"坐标点击重复执行第 {i-1} 次")
-                    time.sleep(self.interval_time)
-                return True
-            elif retry == -1:
-                while self.is_running:
-                    pyautogui.click(x, y)
-                    time.sleep(self.interval_time)
-                return True
-
-            return True
-        except Exception as e:
-            self.log(f"坐标点击出错: {str(e)}")
-            return False
-
-    def resolve_image_path(self, img):
-        """
-        解析图片路径，按以下顺序尝试：
-        1. 如果已经是绝对路径，直接使用
-        2. 尝试在Excel文件同目录下查找
-        3. 尝试在EXE文件同目录下查找
-        4. 尝试在当前工作目录下查找
-        """
-        # 如果是绝对路径，直接返回
-        if os.path.isabs(img):
-            return img
-
-        # 尝试在Excel文件同目录下查找
-        if self.excel_dir:
-            excel_dir_path = os.path.join(self.excel_dir, img)
-            if os.path.exists(excel_dir_path):
-                return excel_dir_path
-
-        # 尝试在EXE文件同目录下查找
-        if getattr(sys, 'frozen', False):
-            # 如果是打包后的EXE
-            exe_dir = os.path.dirname(sys.executable)
-            exe_dir_path = os.path.join(exe_dir, img)
-            if os.path.exists(exe_dir_path):
-                return exe_dir_path
-        else:
-            # 如果是Python脚本
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            script_dir_path = os.path.join(script_dir, img)
-            if os.path.exists(script_dir_path):
-                return script_dir_path
-
-        # 尝试在当前工作目录下查找
-        cwd_path = os.path.join(os.getcwd(), img)
-        if os.path.exists(cwd_path):
-            return cwd_path
-
-        # 如果都找不到，返回原始路径（可能会在后续检查中失败）
-        return img
+            self.log_sink.close_file()  # 本次执行的日志文件到此结束
 
     def log(self, message):
-        # 在日志文本框中添加消息
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n")
-        self.log_text.see(tk.END)
-        self.log_text.config(state=tk.DISABLED)
-        # 强制更新界面
-        self.root.update_idletasks()
+        # 只放入日志队列，可以在任何线程中调用；由 flush_log 在界面线程中批量显示
+        self.log_sink.write(message)
+
+    def flush_log(self):
+        """把积压的日志一次性写入日志框，日志框只保留最近 max_log_lines 行"""
+        lines = self.log_sink.drain()
+        if lines:
+            lines = lines[-self.max_log_lines:]
+            self.log_text.config(state=tk.NORMAL)
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+            if line_count > self.max_log_lines:
+                self.log_text.delete('1.0', f"{line_count - self.max_log_lines + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.config(state=tk.DISABLED)
+        self.root.after(self.log_flush_interval, self.flush_log)
 
 
 def main():
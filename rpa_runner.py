@@ -0,0 +1,1159 @@
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from rpa_vision import FrameGrabber, ImageWaiter, LocationMemory, TemplateMatcher
+
+
+# 操作类型（脚本第1列）
+CMD_CLICK = 1
+CMD_DOUBLE_CLICK = 2
+CMD_RIGHT_CLICK = 3
+CMD_INPUT = 4
+CMD_WAIT = 5
+CMD_SCROLL = 6
+CMD_COORD_CLICK = 7
+CMD_WAIT_IMAGE = 8
+
+COMMAND_TYPES = (CMD_CLICK, CMD_DOUBLE_CLICK, CMD_RIGHT_CLICK, CMD_INPUT, CMD_WAIT, CMD_SCROLL, CMD_COORD_CLICK,
+                 CMD_WAIT_IMAGE)
+
+# 图片点击类命令: 操作类型 -> (点击次数, 按键, 日志名称)
+IMAGE_CLICK_ACTIONS = {
+    CMD_CLICK: (1, "left", "单击左键"),
+    CMD_DOUBLE_CLICK: (2, "left", "双击左键"),
+    CMD_RIGHT_CLICK: (1, "right", "右键"),
+}
+
+
+class ScriptError(ValueError):
+    """脚本数据有误"""
+
+
+def parse_coordinates(text):
+    """解析 "x;y" 格式的坐标（也接受获取坐标功能复制的 "x,y"），格式错误时抛出 ValueError"""
+    coords = text.replace(',', ';').split(';')
+    if len(coords) != 2:
+        raise ValueError(f"坐标格式错误: {text}")
+    return int(coords[0]), int(coords[1])
+
+
+class Instruction:
+    """编译后的一条脚本命令，执行时不再读取表格单元格"""
+
+    __slots__ = ('row', 'cmd', 'value', 'retry', 'img_path', 'coords', 'timeout')
+
+    def __init__(self, row, cmd, value, retry=1, img_path=None, coords=None, timeout=None):
+        self.row = row  # 脚本中的行号（从1开始，用于日志）
+        self.cmd = cmd  # 操作类型
+        self.value = value  # 第2列内容（已转换为对应类型）
+        self.retry = retry  # 重试次数：1 为默认，-1 为无限重复，>1 为重复次数
+        self.img_path = img_path  # 图片命令解析后的图片路径
+        self.coords = coords  # 坐标点击命令解析后的 (x, y)
+        self.timeout = timeout  # 等待图片命令的超时时间（秒），None 表示一直等待
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def read_sheet_rows(sheet):
+    """
+    把 xlrd 工作表转换为行列表（不含表头）
+
+    数字和日期单元格转换为 float，文本为 str，布尔值为 bool，空单元格和错误单元格为 None。
+    """
+    rows = []
+    for i in range(1, sheet.nrows):
+        values = []
+        for cell in sheet.row(i):
+            if cell.ctype in (2, 3):
+                values.append(float(cell.value))
+            elif cell.ctype == 1:
+                values.append(cell.value)
+            elif cell.ctype == 4:
+                values.append(bool(cell.value))
+            else:
+                values.append(None)
+        rows.append(values)
+    return rows
+
+
+def _strip_trailing_empty(rows):
+    """去掉末尾的空行（与 xlrd 的 nrows 一致，中间的空行保留并在检查时报错）"""
+    while rows and all(value is None or value == '' for value in rows[-1]):
+        rows.pop()
+    return rows
+
+
+def load_xls_rows(filename):
+    """用 xlrd 读取旧版 .xls 脚本第一个工作表的数据行"""
+    import xlrd
+    wb = xlrd.open_workbook(filename)
+    return read_sheet_rows(wb.sheet_by_index(0))
+
+
+def load_xlsx_rows(filename):
+    """用 openpyxl 只读模式逐行读取 .xlsx 脚本第一个工作表的数据行（新版 xlrd 不支持 .xlsx）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(filename, read_only=True, data_only=True)
+    try:
+        rows = []
+        for values in wb.worksheets[0].iter_rows(min_row=2, values_only=True):
+            rows.append([None if value == '' else value for value in values])
+    finally:
+        wb.close()
+    return _strip_trailing_empty(rows)
+
+
+def _csv_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def load_csv_rows(filename):
+    """
+    读取 CSV 脚本（UTF-8，第一行为表头）
+
+    第1列和第3列按数字读取；第2列只在等待和滚轮命令中按数字读取，其余命令保留原文本。
+    """
+    rows = []
+    with open(filename, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for record in reader:
+            values = [None if text.strip() == '' else text for text in record]
+            if values and values[0] is not None:
+                values[0] = _csv_number(values[0].strip())
+            if len(values) > 2 and values[2] is not None:
+                values[2] = _csv_number(values[2].strip())
+            if len(values) > 1 and values[1] is not None and values[0] in (CMD_WAIT, CMD_SCROLL):
+                values[1] = _csv_number(values[1].strip())
+            rows.append(values)
+    return _strip_trailing_empty(rows)
+
+
+def load_json_rows(filename):
+    """
+    读取 JSON 脚本
+
+    可以是命令列表，或 {"steps": [...]}；每条命令是 [操作类型, 内容, 重试次数] 列表，
+    或 {"type": 1, "value": "button.png", "retry": 1} 对象。第1条命令记为第1行。
+    """
+    with open(filename, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("steps")
+    if not isinstance(data, list):
+        raise ScriptError("JSON 脚本应为命令列表或包含 steps 列表的对象")
+    rows = []
+    for step in data:
+        if isinstance(step, dict):
+            rows.append([step.get("type"), step.get("value"), step.get("retry")])
+        elif isinstance(step, list):
+            rows.append(step)
+        else:
+            rows.append([step])
+    return rows
+
+
+# 扩展名 -> (读取函数, 第一条命令在文件中的行号)
+SCRIPT_LOADERS = {
+    '.xls': (load_xls_rows, 2),
+    '.xlsx': (load_xlsx_rows, 2),
+    '.xlsm': (load_xlsx_rows, 2),
+    '.csv': (load_csv_rows, 2),
+    '.json': (load_json_rows, 1),
+}
+
+# 编译结果的缓存格式版本，编译规则变化时递增，使旧缓存失效
+PROGRAM_CACHE_VERSION = 1
+
+
+def _script_loader(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in SCRIPT_LOADERS:
+        raise ScriptError(f"不支持的脚本格式: {ext or filename}（支持 {', '.join(sorted(SCRIPT_LOADERS))}）")
+    return SCRIPT_LOADERS[ext]
+
+
+def load_script_rows(filename):
+    """按扩展名读取脚本，返回 (数据行, 第一行的行号)"""
+    loader, first_row = _script_loader(filename)
+    return loader(filename), first_row
+
+
+def program_cache_path(filename):
+    """编译结果缓存文件的位置：与脚本同目录、同名加 .rpacache 后缀"""
+    return filename + ".rpacache"
+
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_program_cache(cache_path, digest):
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != PROGRAM_CACHE_VERSION or \
+            data.get("sha256") != digest:
+        return None
+    program = []
+    try:
+        for row, cmd, value, retry, coords, timeout in data["instructions"]:
+            program.append(Instruction(row, cmd, value, retry, coords=tuple(coords) if coords else None,
+                                       timeout=timeout))
+    except (KeyError, TypeError, ValueError):
+        # 缓存文件损坏，重新编译
+        return None
+    return program
+
+
+def _write_program_cache(cache_path, digest, program):
+    data = {
+        "version": PROGRAM_CACHE_VERSION,
+        "sha256": digest,
+        "instructions": [[inst.row, inst.cmd, inst.value, inst.retry, inst.coords, inst.timeout]
+                         for inst in program],
+    }
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # 脚本目录不可写时不缓存
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_program(filename, resolver=None, use_cache=True):
+    """
+    读取、检查并编译脚本，返回 (指令列表, 是否来自缓存)
+
+    支持 .xls、.xlsx、.csv 和 .json。检查通过的编译结果保存在脚本旁的缓存文件中，
+    以脚本内容的 SHA-256 为键；脚本未修改时直接读取缓存，不再解析和检查。
+    图片路径不缓存，每次加载时重新解析（图片可能被移动）。数据有误时抛出 ScriptError。
+    """
+    _script_loader(filename)
+    if resolver is None:
+        resolver = ImagePathResolver(os.path.dirname(os.path.abspath(filename)))
+
+    digest = None
+    cache_path = program_cache_path(filename)
+    if use_cache:
+        digest = _file_digest(filename)
+        program = _read_program_cache(cache_path, digest)
+        if program is not None:
+            for inst in program:
+                if inst.cmd in IMAGE_CLICK_ACTIONS or inst.cmd == CMD_WAIT_IMAGE:
+                    inst.img_path = resolver.resolve(inst.value)
+            return program, True
+
+    rows, first_row = load_script_rows(filename)
+    program = compile_rows(rows, resolver.resolve, first_row=first_row)
+    if use_cache:
+        _write_program_cache(cache_path, digest, program)
+    return program, False
+
+
+def compile_rows(rows, resolve_image=None, first_row=2):
+    """
+    检查脚本数据并编译为指令列表
+
+    rows 中每行依次为 操作类型、内容、重试次数（后面的说明列忽略），first_row 为第一行在脚本中的行号。
+    图片路径、坐标和重试次数只在这里解析一次，执行时直接使用编译结果。
+    数据有误时抛出 ScriptError。
+    """
+    if not rows:
+        raise ScriptError("Excel 文件中没有数据")
+    if resolve_image is None:
+        resolve_image = ImagePathResolver().resolve
+
+    program = []
+    for offset, row in enumerate(rows):
+        line = first_row + offset
+        cmd_type = row[0] if len(row) > 0 else None
+        if not _is_number(cmd_type) or cmd_type not in COMMAND_TYPES:
+            raise ScriptError(f'第 {line} 行, 第1列数据有误')
+        cmd = int(cmd_type)
+
+        value = row[1] if len(row) > 1 else None
+        if cmd in IMAGE_CLICK_ACTIONS or cmd in (CMD_COORD_CLICK, CMD_WAIT_IMAGE):
+            valid = isinstance(value, str)
+        elif cmd == CMD_INPUT:
+            valid = value is not None
+        else:
+            valid = _is_number(value)
+        if not valid:
+            raise ScriptError(f'第 {line} 行, 第2列数据有误')
+
+        # 第3列为非零数字时作为重试次数，否则默认为 1
+        third = row[2] if len(row) > 2 else None
+        retry = 1
+        if _is_number(third) and third != 0:
+            retry = int(third)
+
+        instruction = Instruction(line, cmd, value, retry)
+        if cmd in IMAGE_CLICK_ACTIONS:
+            instruction.img_path = resolve_image(value)
+        elif cmd == CMD_WAIT_IMAGE:
+            # 第3列为等待的秒数，0 或空表示一直等待
+            instruction.img_path = resolve_image(value)
+            if _is_number(third) and third > 0:
+                instruction.timeout = float(third)
+        elif cmd == CMD_INPUT:
+            instruction.value = str(value)
+        elif cmd == CMD_WAIT:
+            instruction.value = float(value)
+        elif cmd == CMD_SCROLL:
+            instruction.value = int(value)
+        elif cmd == CMD_COORD_CLICK:
+            try:
+                instruction.coords = parse_coordinates(value)
+            except ValueError:
+                raise ScriptError(f'第 {line} 行, 坐标格式错误，应为"x;y"')
+        program.append(instruction)
+    return program
+
+
+class ImagePathResolver:
+    """
+    解析图片路径，按以下顺序尝试：
+    1. 如果已经是绝对路径，直接使用
+    2. 尝试在脚本文件同目录下查找
+    3. 尝试在EXE文件（或本程序）同目录下查找
+    4. 尝试在当前工作目录下查找
+
+    同一图片只解析一次；找不到的图片不缓存，文件稍后出现时仍可找到。
+    """
+
+    def __init__(self, script_dir=None):
+        self.script_dir = script_dir
+        self._resolved = {}
+
+    def resolve(self, img):
+        # 如果是绝对路径，直接返回
+        if os.path.isabs(img):
+            return img
+
+        cached = self._resolved.get(img)
+        if cached is not None:
+            return cached
+        path = self._find(img)
+        if path is not None:
+            self._resolved[img] = path
+            return path
+
+        # 如果都找不到，返回原始路径（可能会在后续检查中失败）
+        return img
+
+    def _find(self, img):
+        # 尝试在脚本文件同目录下查找
+        if self.script_dir:
+            script_dir_path = os.path.join(self.script_dir, img)
+            if os.path.exists(script_dir_path):
+                return script_dir_path
+
+        # 尝试在EXE文件同目录下查找
+        if getattr(sys, 'frozen', False):
+            # 如果是打包后的EXE
+            app_dir = os.path.dirname(sys.executable)
+        else:
+            # 如果是Python脚本
+            app_dir = os.path.dirname(os.path.abspath(__file__))
+        app_dir_path = os.path.join(app_dir, img)
+        if os.path.exists(app_dir_path):
+            return app_dir_path
+
+        # 尝试在当前工作目录下查找
+        cwd_path = os.path.join(os.getcwd(), img)
+        if os.path.exists(cwd_path):
+            return cwd_path
+
+        return None
+
+
+class TemplateCache:
+    """
+    模板图片缓存：每张图片只从磁盘读取并解码一次，以灰度数组（或预处理结果）保存在内存中
+
+    按最近使用顺序淘汰，总条数和总字节数都有上限。文件的修改时间变化后重新加载；
+    为避免查找循环中频繁访问磁盘，同一文件最多每 check_interval 秒检查一次修改时间。
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024, check_interval=1.0, prepare=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.prepare = prepare  # 可选：对解码后的灰度数组做预处理（如 TemplateMatcher.prepare）
+        self._entries = OrderedDict()  # 路径 -> [修改时间, 上次检查时间, 灰度数组]
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path):
+        """返回图片的灰度数组，文件不存在或无法解码时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if now - entry[1] < self.check_interval:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[2]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.discard(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                entry[1] = now
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+
+        try:
+            with Image.open(path) as img:
+                array = np.asarray(img.convert('L'))
+            if self.prepare is not None:
+                array = self.prepare(array)
+        except (OSError, ValueError):
+            self.discard(path)
+            return None
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old[2].nbytes
+            self._entries[path] = [mtime, now, array]
+            self.total_bytes += array.nbytes
+            self.loads += 1
+            # 淘汰最久未使用的图片，最新加载的这张始终保留
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                              or self.total_bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted[2].nbytes
+        return array
+
+    def preload(self, paths):
+        """预先加载一组图片，返回无法加载的路径列表"""
+        return [path for path in paths if self.get(path) is None]
+
+    def discard(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry[2].nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class ScreenBackend:
+    """屏幕截图接口"""
+
+    def capture(self, region=None):
+        """截取整个屏幕或 (left, top, width, height) 区域，返回 RGB 图像数组"""
+        raise NotImplementedError
+
+
+class InputBackend:
+    """鼠标、键盘和剪贴板接口"""
+
+    def click(self, x, y, clicks=1, interval=0.0, duration=0.0, button="left"):
+        raise NotImplementedError
+
+    def scroll(self, amount):
+        raise NotImplementedError
+
+    def paste(self, text):
+        """把文本放入剪贴板并粘贴"""
+        raise NotImplementedError
+
+
+class PyAutoGuiBackend(ScreenBackend, InputBackend):
+    """通过 pyautogui 和 pyperclip 操作真实的屏幕、鼠标和键盘"""
+
+    def __init__(self):
+        # 在这里导入，没有图形界面的环境也能导入本模块
+        import pyautogui
+        import pyperclip
+        self._pyautogui = pyautogui
+        self._pyperclip = pyperclip
+
+    def capture(self, region=None):
+        return np.asarray(self._pyautogui.screenshot(region=region))
+
+    def click(self, x, y, clicks=1, interval=0.0, duration=0.0, button="left"):
+        self._pyautogui.click(x, y, clicks=clicks, interval=interval, duration=duration, button=button)
+
+    def scroll(self, amount):
+        self._pyautogui.scroll(amount)
+
+    def paste(self, text):
+        self._pyperclip.copy(text)
+        self._pyautogui.hotkey('ctrl', 'v')
+
+
+class FakeBackend(ScreenBackend, InputBackend):
+    """
+    内存中的模拟后端，用于测试和基准测试
+
+    按虚拟时间依次回放一组合成画面（每张显示 frame_duration 秒，最后一张一直保持），
+    记录所有鼠标键盘操作。sleep 只推进虚拟时钟，不真正等待，运行时间完全确定。
+    """
+
+    def __init__(self, frames, frame_duration=1.0):
+        self.frames = [np.asarray(frame) for frame in frames]
+        if not self.frames:
+            raise ValueError("至少需要一张画面")
+        self.frame_duration = frame_duration
+        self.now = 0.0
+        self.actions = []  # (虚拟时间, 操作名, 参数)
+        self.captures = 0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def current_frame(self):
+        index = int(self.now / self.frame_duration) if self.frame_duration > 0 else 0
+        return self.frames[min(index, len(self.frames) - 1)]
+
+    def capture(self, region=None):
+        self.captures += 1
+        frame = self.current_frame()
+        if region is None:
+            return frame
+        left, top, width, height = region
+        return frame[top:top + height, left:left + width]
+
+    def click(self, x, y, clicks=1, interval=0.0, duration=0.0, button="left"):
+        self.actions.append((self.now, "click", (x, y, clicks, button)))
+        self.sleep(duration + interval * (clicks - 1))
+
+    def scroll(self, amount):
+        self.actions.append((self.now, "scroll", (amount,)))
+
+    def paste(self, text):
+        self.actions.append((self.now, "paste", (text,)))
+
+
+class LatencyHistogram:
+    """按 2 的幂分桶（微秒）的延迟直方图，内存占用固定，可以估算分位数"""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}  # 桶序号 b -> 次数，第 b 个桶的范围为 [2^(b-1), 2^b) 微秒
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = max(int(seconds * 1e6), 0).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """分位数的估计值（秒）：取所在桶的上界，不超过最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+
+class _StepStats:
+    """一行命令的统计：耗时、模板匹配次数和匹配度"""
+
+    __slots__ = ('row', 'name', 'latency', 'matches', 'found', 'score_total', 'score_min', 'score_max')
+
+    def __init__(self, row, name):
+        self.row = row
+        self.name = name
+        self.latency = LatencyHistogram()
+        self.matches = 0  # 模板匹配次数（包括重试）
+        self.found = 0  # 匹配成功的次数
+        self.score_total = 0.0
+        self.score_min = None
+        self.score_max = None
+
+
+class RunProfiler:
+    """
+    执行过程的性能分析
+
+    记录每一行命令和每个阶段（截图、模板匹配、点击、粘贴、各种等待）的延迟直方图，
+    以及每行命令的模板匹配次数和匹配度。结果可以导出为 CSV 汇总表，
+    和 Chrome 跟踪事件 JSON（在 chrome://tracing 或 Perfetto 中打开）。
+
+    trace 为 False 时只统计直方图，不保留跟踪事件；跟踪事件最多保留 max_events 条。
+    """
+
+    def __init__(self, trace=True, max_events=200000, clock=time.perf_counter):
+        self.trace = trace
+        self.max_events = max_events
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.steps = {}  # 行号 -> _StepStats
+        self.phases = {}  # 阶段名 -> LatencyHistogram
+        self.events = []
+        self.dropped_events = 0
+        self._current = None
+        self._origin = self.clock()
+
+    def step(self, instruction):
+        """计时一行命令：with profiler.step(instruction): ..."""
+        stats = self.steps.get(instruction.row)
+        if stats is None:
+            stats = _StepStats(instruction.row, f"第 {instruction.row} 行 命令 {instruction.cmd} {instruction.value}")
+            self.steps[instruction.row] = stats
+        return _StepSpan(self, stats)
+
+    def phase(self, name):
+        """计时一个阶段：with profiler.phase('capture'): ..."""
+        return _PhaseSpan(self, name)
+
+    def add_phase(self, name, start, seconds):
+        histogram = self.phases.get(name)
+        if histogram is None:
+            histogram = self.phases[name] = LatencyHistogram()
+        histogram.add(seconds)
+        self._add_event(name, "phase", start, seconds)
+
+    def record_match(self, score, found):
+        """记录当前命令中的一次模板匹配（score 为最高匹配度，区域太小时为 None）"""
+        stats = self._current
+        if stats is None:
+            return
+        stats.matches += 1
+        if found:
+            stats.found += 1
+        if score is not None:
+            stats.score_total += score
+            stats.score_min = score if stats.score_min is None else min(stats.score_min, score)
+            stats.score_max = score if stats.score_max is None else max(stats.score_max, score)
+
+    def _add_event(self, name, category, start, seconds, args=None):
+        if not self.trace:
+            return
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+        event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": round((start - self._origin) * 1e6, 1), "dur": round(seconds * 1e6, 1)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def rows(self):
+        """汇总表的所有行：先是每行命令（按行号），然后是各阶段"""
+        result = []
+        for row in sorted(self.steps):
+            stats = self.steps[row]
+            scored = stats.score_min is not None
+            result.append(_summary_row("step", stats.name, stats.latency, row=row, matches=stats.matches,
+                                       found=stats.found,
+                                       score_mean=stats.score_total / stats.matches if scored else None,
+                                       score_min=stats.score_min, score_max=stats.score_max))
+        for name in sorted(self.phases):
+            result.append(_summary_row("phase", name, self.phases[name]))
+        return result
+
+    def save_csv(self, filename):
+        """导出汇总表（utf-8-sig 编码，Excel 可以直接打开）"""
+        with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=PROFILE_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+    def save_trace(self, filename):
+        """导出 Chrome 跟踪事件 JSON"""
+        data = {"traceEvents": self.events, "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped_events}}
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def summary(self):
+        """各阶段耗时的简要说明"""
+        parts = [f"{name} {h.count} 次 共 {h.total:.3f} 秒" for name, h in sorted(self.phases.items())]
+        return "阶段耗时: " + ("，".join(parts) if parts else "无")
+
+
+PROFILE_FIELDS = ["kind", "name", "row", "count", "total_ms", "mean_ms", "min_ms", "p50_ms", "p90_ms", "p99_ms",
+                  "max_ms", "matches", "matches_per_run", "found", "score_mean", "score_min", "score_max"]
+
+
+def _summary_row(kind, name, histogram, row=None, matches=None, found=None, score_mean=None, score_min=None,
+                 score_max=None):
+    def ms(seconds):
+        return round(seconds * 1000, 3)
+
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+
+    return {
+        "kind": kind,
+        "name": name,
+        "row": row,
+        "count": histogram.count,
+        "total_ms": ms(histogram.total),
+        "mean_ms": ms(histogram.mean),
+        "min_ms": ms(histogram.min or 0.0),
+        "p50_ms": ms(histogram.percentile(0.5)),
+        "p90_ms": ms(histogram.percentile(0.9)),
+        "p99_ms": ms(histogram.percentile(0.99)),
+        "max_ms": ms(histogram.max),
+        "matches": matches,
+        "matches_per_run": round(matches / histogram.count, 2) if matches is not None and histogram.count else None,
+        "found": found,
+        "score_mean": rounded(score_mean),
+        "score_min": rounded(score_min),
+        "score_max": rounded(score_max),
+    }
+
+
+class _PhaseSpan:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add_phase(self.name, self.start, self.profiler.clock() - self.start)
+
+
+class _StepSpan:
+    def __init__(self, profiler, stats):
+        self.profiler = profiler
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        self.matches = self.stats.matches
+        self.profiler._current = self.stats
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        profiler = self.profiler
+        stats = self.stats
+        seconds = profiler.clock() - self.start
+        profiler._current = None
+        stats.latency.add(seconds)
+        profiler._add_event(stats.name, "step", self.start, seconds,
+                            {"row": stats.row, "matches": stats.matches - self.matches})
+
+
+class _ProfiledMatcher:
+    """包装 TemplateMatcher：匹配耗时计入 match 阶段，并记录每次匹配的最高匹配度"""
+
+    def __init__(self, matcher, profiler):
+        self.matcher = matcher
+        self.profiler = profiler
+
+    def prepare(self, image):
+        return self.matcher.prepare(image)
+
+    def match(self, frame, template, region=None, confidence=None):
+        with self.profiler.phase("match"):
+            best = self.matcher.best_match(frame, template, region)
+        if confidence is None:
+            confidence = self.matcher.confidence
+        found = best is not None and best.score >= confidence
+        self.profiler.record_match(best.score if best is not None else None, found)
+        return best if found else None
+
+
+class AutomationRunner:
+    """
+    脚本执行器，不依赖图形界面
+
+    屏幕截图和鼠标键盘操作分别通过 screen 和 input_backend 完成；
+    clock 和 sleep 可以替换为虚拟时钟（见 FakeBackend），使执行时间可以确定地复现。
+    """
+
+    def __init__(self, screen, input_backend, log=None, interval_time=0.01, image_timeout=1.0, confidence=0.8,
+                 max_poll_interval=0.05, clock=time.monotonic, sleep=time.sleep, profiler=None):
+        self.screen = screen
+        self.input = input_backend
+        self.log = log if log is not None else (lambda message: None)
+        self.interval_time = interval_time  # 操作间隔时间（秒）
+        self.image_timeout = image_timeout  # 单击图片命令（重试次数为1）查找图片的最长时间（秒）
+        self.clock = clock
+        self.sleep = sleep
+        self.is_running = False
+        self.profiler = profiler if profiler is not None else RunProfiler(trace=False)  # 每行命令和各阶段的耗时
+
+        self.matcher = TemplateMatcher(confidence=confidence)  # 模板匹配引擎
+        self.locations = LocationMemory(_ProfiledMatcher(self.matcher, self.profiler))  # 每个模板上次找到的位置
+        self.frames = FrameGrabber(self.capture, max_age=0.1, clock=clock)  # 共享的屏幕截图
+        # 等待图片出现（画面不变时不做匹配）；画面不变时检查间隔最长 max_poll_interval 秒，即图片出现后最多晚这么久发现
+        self.waiter = ImageWaiter(self.locations, self.frames, max_interval=max_poll_interval,
+                                  sleep=lambda seconds: self.pause(seconds, "wait_poll"), clock=clock)
+        self.template_cache = TemplateCache(prepare=self.matcher.prepare)  # 模板图片缓存
+
+        # 操作类型 -> 执行函数
+        self.instruction_handlers = {
+            CMD_CLICK: self.run_image_click,
+            CMD_DOUBLE_CLICK: self.run_image_click,
+            CMD_RIGHT_CLICK: self.run_image_click,
+            CMD_INPUT: self.run_input,
+            CMD_WAIT: self.run_wait,
+            CMD_SCROLL: self.run_scroll,
+            CMD_COORD_CLICK: self.run_coordinate_click,
+            CMD_WAIT_IMAGE: self.run_wait_image,
+        }
+
+    def preload(self, program):
+        """预先加载所有模板图片，执行时不再读取和解码图片文件"""
+        image_paths = {inst.img_path for inst in program if inst.img_path is not None}
+        for path in self.template_cache.preload(sorted(image_paths)):
+            self.log(f"警告：图片文件无法加载: {path}")
+
+    def run(self, program, loops=None):
+        """
+        执行指令列表
+
+        loops 为 None 时执行一次；为 0 时无限循环，直到调用 stop()；否则循环 loops 次。
+        """
+        self.is_running = True
+        self.profiler.reset()
+        self.locations.reset_counters()
+        self.matcher.spectra.reset_counters()
+        self.frames.reset_counters()
+        self.waiter.reset_counters()
+        try:
+            if loops is None:
+                # 执行一次
+                self.run_once(program)
+                self.log("执行完成!")
+            else:
+                # 循环执行（0 为无限循环）
+                count = 1
+                while self.is_running and (loops == 0 or count <= loops):
+                    self.log(f"第 {count} 次循环执行...")
+                    self.run_once(program)
+                    self.pause(self.interval_time)
+                    count += 1
+
+            self.log(self.locations.summary())
+            self.log(self.matcher.spectra.summary())
+            self.log(self.frames.summary())
+            self.log(self.waiter.summary())
+            self.log(self.profiler.summary())
+        finally:
+            self.is_running = False
+
+    def stop(self):
+        self.is_running = False
+
+    def run_once(self, program):
+        handlers = self.instruction_handlers
+        for instruction in program:
+            if not self.is_running:
+                break
+
+            try:
+                with self.profiler.step(instruction):
+                    handlers[instruction.cmd](instruction)
+            except Exception as e:
+                self.log(f"执行第 {instruction.row} 行命令时发生错误: {str(e)}，跳过此命令")
+
+    def run_image_click(self, instruction):
+        click_times, button, name = IMAGE_CLICK_ACTIONS[instruction.cmd]
+        img = instruction.value
+        success = self.mouse_click(click_times, button, img, instruction.retry, instruction.img_path)
+        if success:
+            self.log(f"{name}: {img}")
+        else:
+            self.log(f"跳过第 {instruction.row} 行命令：{name} {img}")
+
+    def run_wait_image(self, instruction):
+        img = instruction.value
+        template = self.template_cache.get(instruction.img_path)
+        if template is None:
+            self.log(f"错误：图片文件 '{img}' 不存在（尝试路径: {instruction.img_path}）")
+            return
+        self.log(f"等待图片出现: {img}")
+        location = self.waiter.wait(template, instruction.img_path, timeout=instruction.timeout,
+                                    should_continue=lambda: self.is_running)
+        if location is not None:
+            self.log(f"图片已出现: {img}，位置: ({location.x}, {location.y})")
+        elif self.is_running:
+            self.log(f"等待图片超时（{instruction.timeout} 秒）: {img}")
+
+    def run_input(self, instruction):
+        with self.profiler.phase("paste"):
+            self.input.paste(instruction.value)
+        self.frames.invalidate()
+        self.pause(0.5, "paste_settle")
+        self.log(f"输入: {instruction.value}")
+
+    def run_wait(self, instruction):
+        self.pause(instruction.value, "wait")
+        self.log(f"等待 {instruction.value} 秒")
+
+    def run_scroll(self, instruction):
+        with self.profiler.phase("scroll"):
+            self.input.scroll(instruction.value)
+        self.frames.invalidate()
+        self.log(f"滚轮滑动 {instruction.value} 距离")
+
+    def run_coordinate_click(self, instruction):
+        coord_str = instruction.value
+        x, y = instruction.coords
+        success = self.coordinate_click(x, y, instruction.retry)
+        if success:
+            self.log(f"坐标点击: {coord_str}")
+        else:
+            self.log(f"跳过第 {instruction.row} 行命令：坐标点击 {coord_str}")
+
+    def mouse_click(self, click_times, l_or_r, img, retry, img_path):
+        # 从缓存中取出模板图片（文件不存在或无法解码时为 None）
+        template = self.template_cache.get(img_path)
+        if template is None:
+            self.log(f"错误：图片文件 '{img}' 不存在（尝试路径: {img_path}）")
+            return False
+
+        self.log(f"正在查找图片: {img_path}")
+
+        if retry == 1:
+            # 在 image_timeout 秒内等待图片出现，画面不变时不重复匹配
+            location = self.waiter.wait(template, img_path, timeout=self.image_timeout,
+                                        should_continue=lambda: self.is_running)
+            if location is not None:
+                self.log(f"找到图片，位置: ({location.x}, {location.y})，匹配度: {location.score:.2f}")
+                self.click(location.x, location.y, clicks=click_times,
+                           interval=0.2, duration=0.2, button=l_or_r)
+                return True
+
+            self.log(f"未找到匹配图片 '{img}'，跳过此命令")
+            return False
+
+        elif retry == -1:
+            while self.is_running:
+                location = self.waiter.wait(template, img_path, should_continue=lambda: self.is_running)
+                if location is not None:
+                    self.click(location.x, location.y, clicks=click_times,
+                               interval=0.2, duration=0.2, button=l_or_r)
+                self.pause(self.interval_time)
+            return True
+
+        elif retry > 1:
+            i = 1
+            while i < retry + 1 and self.is_running:
+                i += 1
+                location = self.locate_image(template, img_path)
+                if location is not None:
+                    self.click(location.x, location.y, clicks=click_times,
+                               interval=0.2, duration=0.2, button=l_or_r)
+                    self.log(f"重复执行第 {i-1} 次")
+                else:
+                    self.log(f"第 {i-1} 次尝试未找到图片，继续重试")
+                self.pause(self.interval_time)
+            return True
+        return True
+
+    def locate_image(self, template, key, region=None):
+        """
+        截取屏幕并查找模板图片，找到时返回 Match（带中心坐标和匹配度），否则返回 None
+
+        先在该图片（key）上次出现的位置附近查找，找不到再搜索整个屏幕。
+        一定时间内的多次查找共用同一张截图，见 FrameGrabber。
+        """
+        return self.locations.locate(self.frames, template, key, region=region)
+
+    def click(self, x, y, **kwargs):
+        """点击后屏幕可能变化，丢弃共享截图"""
+        with self.profiler.phase("click"):
+            self.input.click(x, y, **kwargs)
+        self.frames.invalidate()
+
+    def capture(self, region=None):
+        """截取屏幕，耗时计入 capture 阶段"""
+        with self.profiler.phase("capture"):
+            return self.screen.capture(region)
+
+    def pause(self, seconds, phase="interval"):
+        """等待 seconds 秒，耗时计入 phase 阶段"""
+        with self.profiler.phase(phase):
+            self.sleep(seconds)
+
+    def coordinate_click(self, x, y, retry):
+        """根据坐标进行点击"""
+        try:
+            # 执行点击
+            if retry == 1:
+                self.click(x, y)
+                return True
+            elif retry > 1:
+                i = 1
+                while i <= retry and self.is_running:
+                    i += 1
+                    self.click(x, y)
+                    self.log(f"坐标点击重复执行第 {i-1} 次")
+                    self.pause(self.interval_time)
+                return True
+            elif retry == -1:
+                while self.is_running:
+                    self.click(x, y)
+                    self.pause(self.interval_time)
+                return True
+
+            return True
+        except Exception as e:
+            self.log(f"坐标点击出错: {str(e)}")
+            return False
+
+
+def load_frames(filenames):
+    """读取模拟后端回放用的画面图片"""
+    frames = []
+    for filename in filenames:
+        with Image.open(filename) as img:
+            frames.append(np.asarray(img.convert('RGB')))
+    return frames
+
+
+def print_log(message):
+    print(f"{time.strftime('%H:%M:%S')} - {message}", flush=True)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="无界面执行 RPA 自动化脚本")
+    parser.add_argument("script", help="脚本文件（.xls、.xlsx、.csv 或 .json）")
+    parser.add_argument("-n", "--loops", type=int, default=None,
+                        help="循环次数（0 为无限循环，默认只执行一次）")
+    parser.add_argument("-i", "--interval", type=float, default=0.01, help="操作间隔时间（秒，默认 0.01）")
+    parser.add_argument("--image-timeout", type=float, default=1.0,
+                        help="单击图片命令查找图片的最长时间（秒，默认 1.0）")
+    parser.add_argument("--max-poll-interval", type=float, default=0.05,
+                        help="等待图片时两次检查画面的最长间隔（秒，默认 0.05）")
+    parser.add_argument("--confidence", type=float, default=0.8, help="图片匹配度阈值（默认 0.8）")
+    parser.add_argument("--check", action="store_true", help="只检查脚本数据，不执行")
+    parser.add_argument("--no-cache", action="store_true", help="不使用也不保存脚本的编译缓存")
+    parser.add_argument("--fake", nargs="+", metavar="FRAME",
+                        help="使用模拟后端：按顺序回放这些画面图片，不操作真实的鼠标键盘")
+    parser.add_argument("--frame-duration", type=float, default=1.0,
+                        help="模拟后端每张画面显示的虚拟时间（秒，默认 1.0）")
+    parser.add_argument("--profile-csv", metavar="FILE", help="执行结束后导出每行命令和各阶段的耗时统计（CSV）")
+    parser.add_argument("--trace", metavar="FILE", help="执行结束后导出 Chrome 跟踪事件 JSON（chrome://tracing）")
+    return parser
+
+
+def run_cli(args):
+    script_path = os.path.abspath(args.script)
+    try:
+        program, cached = load_program(script_path, use_cache=not args.no_cache)
+    except ScriptError as e:
+        print_log(str(e))
+        print_log("数据检查未通过，请检查脚本内容!")
+        return 1
+    except Exception as e:
+        print_log(f"读取脚本出错: {str(e)}")
+        return 1
+
+    print_log(f"数据检查通过，共 {len(program)} 条命令{'（使用编译缓存）' if cached else ''}")
+    if args.check:
+        return 0
+
+    if args.fake:
+        backend = FakeBackend(load_frames(args.fake), frame_duration=args.frame_duration)
+        # 计时包括实际的计算时间和模拟的等待时间
+        profiler = RunProfiler(trace=args.trace is not None, clock=lambda: time.perf_counter() + backend.now)
+        runner = AutomationRunner(backend, backend, log=print_log, interval_time=args.interval,
+                                  image_timeout=args.image_timeout, confidence=args.confidence,
+                                  max_poll_interval=args.max_poll_interval, clock=backend.clock, sleep=backend.sleep, profiler=profiler)
+    else:
+        backend = PyAutoGuiBackend()
+        profiler = RunProfiler(trace=args.trace is not None)
+        runner = AutomationRunner(backend, backend, log=print_log, interval_time=args.interval,
+                                  image_timeout=args.image_timeout, confidence=args.confidence,
+                                  max_poll_interval=args.max_poll_interval, profiler=profiler)
+
+    runner.preload(program)
+    started = time.perf_counter()
+    status = 0
+    try:
+        runner.run(program, loops=args.loops)
+        print_log(f"自动化任务执行完毕，用时 {time.perf_counter() - started:.3f} 秒")
+    except KeyboardInterrupt:
+        runner.stop()
+        print_log("执行已中断")
+        status = 130
+
+    # 中断时也导出已记录的部分
+    if args.profile_csv:
+        profiler.save_csv(args.profile_csv)
+        print_log(f"耗时统计已保存到: {args.profile_csv}")
+    if args.trace:
+        profiler.save_trace(args.trace)
+        print_log(f"跟踪事件已保存到: {args.trace}")
+    if status:
+        return status
+
+    if args.fake:
+        print_log(f"模拟后端：虚拟时间 {backend.now:.2f} 秒，截图 {backend.captures} 次，"
+                  f"操作 {len(backend.actions)} 次")
+        for at, name, params in backend.actions:
+            print(f"  {at:8.2f}s  {name} {params}")
+    return 0
+
+
+def main(argv=None):
+    return run_cli(build_arg_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
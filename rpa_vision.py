@@ -0,0 +1,673 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# 灰度转换权重（ITU-R BT.601）
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# 每像素灰度方差低于此值（标准差 0.1 级灰度）的模板或窗口视为纯色。
+# 窗口方差由累加和相减得到，误差随整幅图像的累加值增大，远大于浮点精度本身，
+# 纯色窗口算出的方差只是舍入误差，不能用来归一化
+FLAT_VARIANCE = 0.01
+
+
+def to_gray(image):
+    """把 RGB/RGBA/灰度图像（numpy 数组或 PIL 图像）转换为 float32 灰度数组"""
+    array = np.asarray(image)
+    if array.ndim == 3:
+        array = array[..., :3] @ GRAY_WEIGHTS
+    return np.ascontiguousarray(array, dtype=np.float32)
+
+
+def downsample(image):
+    """2x2 平均池化，尺寸减半（奇数边丢弃最后一行/列）"""
+    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    result = image[0:h:2, 0:w:2] + image[1:h:2, 0:w:2]
+    result += image[0:h:2, 1:w:2]
+    result += image[1:h:2, 1:w:2]
+    result *= 0.25
+    return result
+
+
+def _box_sums(image, h, w):
+    """每个 h x w 窗口内的像素和（先按列再按行做累加差分）"""
+    columns = np.cumsum(image, axis=0, dtype=np.float64)
+    rows = np.empty((columns.shape[0] - h + 1, columns.shape[1]))
+    rows[0] = columns[h - 1]
+    np.subtract(columns[h:], columns[:-h], out=rows[1:])
+    totals = np.cumsum(rows, axis=1)
+    result = np.empty((rows.shape[0], rows.shape[1] - w + 1))
+    result[:, 0] = totals[:, w - 1]
+    np.subtract(totals[:, w:], totals[:, :-w], out=result[:, 1:])
+    return result
+
+
+def _window_sums(image, h, w):
+    """计算每个 h x w 窗口内的像素和与平方和"""
+    return _box_sums(image, h, w), _box_sums(np.square(image, dtype=np.float64), h, w)
+
+
+def _normalize(numerator, sums, sq_sums, level):
+    """把相关值换算为归一化互相关分数（-1 ~ 1）"""
+    n = level.size
+    variance = np.maximum(sq_sums - sums * sums / n, 0.0)
+    if level.flat:
+        # 纯色模板没有方差，改为比较窗口平均灰度；只有同样接近纯色的窗口才算匹配
+        flat = variance < n
+        score = 1.0 - np.abs(sums / n - level.mean) / 255.0
+        return np.where(flat, score, 0.0)
+    # 零均值模板的元素和因舍入不严格为 0，减去窗口均值与它的乘积
+    numerator = numerator - sums * (level.residual / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = numerator / (np.sqrt(variance) * level.norm)
+    # 纯色窗口与非纯色模板不相关
+    scores[variance <= n * FLAT_VARIANCE] = 0.0
+    return np.clip(scores, -1.0, 1.0)
+
+
+def fft_size(n):
+    """不小于 n 的最小 5-smooth 数（只含因子 2、3、5），FFT 在这些长度上最快"""
+    best = 1 << max(n - 1, 0).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            size = p35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def template_spectrum(level, shape):
+    """模板在给定 FFT 尺寸下的频谱共轭"""
+    return np.conj(np.fft.rfft2(level.zero_mean, shape))
+
+
+def ncc_full(image, level, spectra=None):
+    """
+    用 FFT 计算模板在整幅图像上每个位置的归一化互相关分数
+
+    spectra 为 SpectrumCache 时从中取模板频谱，否则每次重新计算。
+    """
+    h, w = level.shape
+    height, width = image.shape
+    shape = (fft_size(height), fft_size(width))
+    spectrum = spectra.get(level, shape) if spectra is not None else template_spectrum(level, shape)
+    # numpy 的 FFT 对 float64 比 float32 快
+    spectrum = np.fft.rfft2(image.astype(np.float64), shape) * spectrum
+    correlation = np.fft.irfft2(spectrum, shape)[:height - h + 1, :width - w + 1]
+    sums, sq_sums = _window_sums(image, h, w)
+    return _normalize(correlation, sums, sq_sums, level)
+
+
+def ncc_phases(image, levels, spectra=None):
+    """
+    几个同样尺寸的模板在整幅图像上的归一化互相关分数，每个位置取其中的最大值
+
+    图像的频谱和窗口方差只计算一次，每个模板只多做一次逆 FFT。
+    分数只用来挑选候选位置（之后都在原图上重新计算），省去 _normalize 中对模板元素和舍入误差的修正。
+    """
+    h, w = levels[0].shape
+    height, width = image.shape
+    n = h * w
+    shape = (fft_size(height), fft_size(width))
+    image_spectrum = np.fft.rfft2(image.astype(np.float64), shape)
+    sums, sq_sums = _window_sums(image, h, w)
+    product = np.empty_like(image_spectrum)
+    best = None
+    for level in levels:
+        # 窗口的标准差对每个模板都一样，先比较除以模板范数后的相关值，最后统一除以窗口标准差
+        spectrum = spectra.get(level, shape) if spectra is not None else template_spectrum(level, shape)
+        np.multiply(image_spectrum, spectrum, out=product)
+        correlation = np.fft.irfft2(product, shape)[:height - h + 1, :width - w + 1]
+        correlation *= 1.0 / level.norm
+        best = correlation if best is None else np.maximum(best, correlation, out=best)
+    variance = np.maximum(sq_sums - sums * sums / n, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        best /= np.sqrt(variance)
+    # 纯色窗口与非纯色模板不相关
+    best[variance <= n * FLAT_VARIANCE] = 0.0
+    return np.clip(best, -1.0, 1.0, out=best)
+
+
+def ncc_window(image, level):
+    """直接计算小范围图像上每个位置的归一化互相关分数（用于精细搜索）"""
+    h, w = level.shape
+    windows = sliding_window_view(image, (h, w))
+    correlation = np.einsum('ijkl,kl->ij', windows, level.zero_mean, dtype=np.float64)
+    sums, sq_sums = _window_sums(image, h, w)
+    return _normalize(correlation, sums, sq_sums, level)
+
+
+def ncc_at(image, level, row, col):
+    """
+    直接计算模板在 (row, col) 处的归一化互相关分数
+
+    先减去窗口均值再求方差和相关值，不受累加和相减与 FFT 的舍入误差影响，用于确认最终结果。
+    """
+    h, w = level.shape
+    window = image[row:row + h, col:col + w].astype(np.float64)
+    mean = float(window.mean())
+    window -= mean
+    variance = float(np.square(window).sum())
+    if level.flat:
+        return 1.0 - abs(mean - level.mean) / 255.0 if variance < level.size else 0.0
+    if variance <= level.size * FLAT_VARIANCE:
+        return 0.0
+    score = float((window * level.zero_mean).sum()) / (np.sqrt(variance) * level.norm)
+    return min(max(score, -1.0), 1.0)
+
+
+class _TemplateLevel:
+    __slots__ = ('shape', 'size', 'mean', 'zero_mean', 'residual', 'norm', 'flat')
+
+    def __init__(self, gray):
+        self.shape = gray.shape
+        self.size = gray.size
+        self.mean = float(gray.mean(dtype=np.float64))
+        # float64 保存，元素和的舍入误差乘以窗口均值后仍远小于真实的相关值
+        self.zero_mean = gray.astype(np.float64) - self.mean
+        self.residual = float(self.zero_mean.sum())
+        self.norm = float(np.sqrt(np.square(self.zero_mean).sum()))
+        self.flat = self.norm * self.norm < FLAT_VARIANCE * self.size
+
+
+class Template:
+    """
+    预处理后的模板图片
+
+    保存每一层金字塔的零均值灰度数组和范数，匹配时不再重复计算。
+    最粗一层模板的短边不小于 min_size 像素。
+
+    缩小一半时模板与屏幕像素网格有 4 种对齐方式（行、列各偏移 0 或 1 像素），小模板的笔画只有一两个像素宽，
+    对不齐时缩小后的样子完全不同。短边小于 phase_size 的模板不建缩小层，改为在 phases 中保存模板
+    从这 4 种偏移处缩小一半的结果（裁成同样尺寸），在缩小一半的图像上用它们查找，
+    不论实际位置的奇偶都能完全对上，也不必在原图上做整幅 FFT。
+    """
+
+    def __init__(self, image, min_size=8, max_levels=4, phase_size=24):
+        gray = to_gray(image)
+        if gray.ndim != 2 or gray.size == 0:
+            raise ValueError("模板图片为空")
+        self.height, self.width = gray.shape
+        self.levels = [_TemplateLevel(gray)]
+        self.phases = []
+        rows, cols = (self.height - 1) // 2 * 2, (self.width - 1) // 2 * 2
+        # 缩小后短边至少 4 像素
+        if min(self.height, self.width) < phase_size and min(rows, cols) >= 8 and not self.levels[0].flat:
+            phases = [_TemplateLevel(downsample(gray[dy:dy + rows, dx:dx + cols])) for dy in (0, 1) for dx in (0, 1)]
+            # 某种偏移裁掉了模板中唯一有变化的行或列时，只能在原图上查找
+            if not any(phase.flat for phase in phases):
+                self.phases = phases
+        while not self.phases and len(self.levels) < max_levels and min(gray.shape) // 2 >= min_size:
+            gray = downsample(gray)
+            self.levels.append(_TemplateLevel(gray))
+
+    @property
+    def nbytes(self):
+        return sum(level.zero_mean.nbytes for level in self.levels + self.phases)
+
+
+class Match:
+    """一次模板匹配的结果：左上角坐标、尺寸和匹配分数"""
+
+    __slots__ = ('left', 'top', 'width', 'height', 'score')
+
+    def __init__(self, left, top, width, height, score):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.score = score
+
+    @property
+    def x(self):
+        """中心点 x 坐标"""
+        return self.left + self.width // 2
+
+    @property
+    def y(self):
+        """中心点 y 坐标"""
+        return self.top + self.height // 2
+
+    def __repr__(self):
+        return f"Match(x={self.x}, y={self.y}, score={self.score:.3f})"
+
+
+class SpectrumCache:
+    """
+    模板频谱缓存：同一模板在同样尺寸的图像上反复查找时，模板的 FFT 只计算一次
+
+    所有模板共用一个缓存，按最近使用顺序淘汰，总字节数不超过 max_bytes。
+    频谱与搜索区域一样大（1080p 整幅图像上约 16 MB，缩小一半约 4 MB），远大于模板本身，
+    所以不计入 Template.nbytes，由这里单独限制；单份超过上限的频谱用完即丢。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (模板层, FFT 尺寸) -> 模板频谱的共轭
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, level, shape):
+        """返回模板层在给定 FFT 尺寸下的频谱共轭"""
+        key = (level, shape)
+        spectrum = self._entries.get(key)
+        if spectrum is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return spectrum
+        self.misses += 1
+        spectrum = template_spectrum(level, shape)
+        if spectrum.nbytes <= self.max_bytes:
+            self._entries[key] = spectrum
+            self.total_bytes += spectrum.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+        return spectrum
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self):
+        return (f"模板频谱复用 {self.hits} 次，重新计算 {self.misses} 次，"
+                f"缓存占用 {self.total_bytes / 1024 / 1024:.1f} MB")
+
+
+class TemplateMatcher:
+    """
+    基于图像金字塔的由粗到精模板匹配
+
+    先在缩小的图像上用 FFT 对整个搜索区域做归一化互相关，取分数最高的几个候选位置，
+    再逐层放大，只在候选位置附近的小窗口内精细搜索；小模板按 4 种对齐方式在缩小一半的图像上查找（见 Template）。
+    所有计算都在内存中的数组上进行，不依赖屏幕，可以直接用合成图像测试。
+    """
+
+    def __init__(self, confidence=0.8, candidates=5, refine_radius=2, min_size=8, max_levels=4,
+                 direct_area=256 * 256, early_accept=0.95, phase_size=24, spectrum_bytes=64 * 1024 * 1024):
+        self.confidence = confidence
+        self.candidates = candidates  # 最粗一层保留的候选位置数
+        self.refine_radius = refine_radius  # 每层精细搜索的半径（像素）
+        self.min_size = min_size
+        self.max_levels = max_levels
+        self.phase_size = phase_size  # 短边小于此值的模板按 4 种对齐方式在缩小一半的图像上查找
+        self.direct_area = direct_area  # 搜索区域不超过这个像素数时不建金字塔，直接在原图上匹配
+        self.early_accept = early_accept  # 某个候选精细匹配后达到此分数时不再检查其余候选
+        self.spectra = SpectrumCache(spectrum_bytes)  # 所有模板共用的频谱缓存
+
+    def prepare(self, image):
+        """把模板图片预处理为 Template"""
+        if isinstance(image, Template):
+            return image
+        return Template(image, min_size=self.min_size, max_levels=self.max_levels, phase_size=self.phase_size)
+
+    def match(self, frame, template, region=None, confidence=None):
+        """
+        在 frame 中查找模板，分数不低于 confidence 时返回 Match，否则返回 None
+
+        region 为 (left, top, width, height)，只在该区域内查找；返回的坐标始终相对于整个 frame。
+        """
+        best = self.best_match(frame, template, region)
+        if confidence is None:
+            confidence = self.confidence
+        if best is None or best.score < confidence:
+            return None
+        return best
+
+    def best_match(self, frame, template, region=None):
+        """返回分数最高的位置（不论分数高低），搜索区域比模板小时返回 None"""
+        template = self.prepare(template)
+        frame = np.asarray(frame)
+        left, top = 0, 0
+        if region is not None:
+            # 先裁剪再转换灰度，小区域查找时不处理整幅图像
+            left, top, width, height = clip_region(region, frame.shape)
+            frame = frame[top:top + height, left:left + width]
+        gray = to_gray(frame)
+        if gray.shape[0] < template.height or gray.shape[1] < template.width:
+            return None
+
+        # 搜索区域的金字塔层数不超过模板的层数
+        pyramid = [gray]
+        levels = len(template.levels) if gray.size > self.direct_area else 1
+        while len(pyramid) < levels:
+            pyramid.append(downsample(pyramid[-1]))
+        depth = len(pyramid) - 1
+        while pyramid[depth].shape[0] < template.levels[depth].shape[0] or \
+                pyramid[depth].shape[1] < template.levels[depth].shape[1]:
+            depth -= 1
+
+        if depth == 0 and template.phases and gray.size > self.direct_area:
+            # 没有缩小层的小模板用 4 种对齐方式在缩小一半的图像上查找，分数合在一起，候选位置也多留几倍
+            pyramid = [gray, downsample(gray)]
+            depth = 1
+            scores = ncc_phases(pyramid[1], template.phases, self.spectra)
+            candidates = self._top_candidates(scores, template.phases[0].shape, 4 * self.candidates)
+        else:
+            scores = ncc_full(pyramid[depth], template.levels[depth], self.spectra)
+            if depth == 0:
+                row, col = np.unravel_index(int(np.argmax(scores)), scores.shape)
+                row, col = int(row), int(col)
+                return Match(left + col, top + row, template.width, template.height,
+                             ncc_at(gray, template.levels[0], row, col))
+            candidates = self._top_candidates(scores, template.levels[depth].shape, self.candidates)
+
+        # 所有候选位置先精细定位到原图，按原图上的分数从高到低确认，粗层分数相近的相似位置不会抢先被接受；
+        # 分数都在原图上直接重新计算，只有确认后的分数才能提前结束
+        refined = sorted((self._refine(pyramid, template, depth, row, col) for row, col in candidates), reverse=True)
+        best = None
+        for _, row, col in refined:
+            score = ncc_at(gray, template.levels[0], row, col)
+            if best is None or score > best[1]:
+                best = ((row, col), score)
+            if score >= self.early_accept:
+                break
+        (row, col), score = best
+        return Match(left + col, top + row, template.width, template.height, score)
+
+    def _top_candidates(self, scores, shape, count):
+        """取分数最高的 count 个位置，相邻位置只保留一个（非极大值抑制）"""
+        scores = scores.copy()
+        h, w = shape
+        result = []
+        for _ in range(count):
+            index = int(np.argmax(scores))
+            row, col = np.unravel_index(index, scores.shape)
+            if result and scores[row, col] <= -1.0:
+                break
+            result.append((int(row), int(col)))
+            scores[max(0, row - h // 2):row + h // 2 + 1, max(0, col - w // 2):col + w // 2 + 1] = -np.inf
+        return result
+
+    def _refine(self, pyramid, template, depth, row, col):
+        """从第 depth 层的候选位置开始，逐层放大并在附近窗口内重新定位，返回 (原图上的分数, 行, 列)"""
+        radius = self.refine_radius
+        for level_index in range(depth - 1, -1, -1):
+            image = pyramid[level_index]
+            level = template.levels[level_index]
+            h, w = level.shape
+            row, col = row * 2, col * 2
+            top = min(max(row - radius, 0), image.shape[0] - h)
+            left = min(max(col - radius, 0), image.shape[1] - w)
+            bottom = min(row + radius + h, image.shape[0])
+            right = min(col + radius + w, image.shape[1])
+            scores = ncc_window(image[top:bottom, left:right], level)
+            r, c = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            row, col = top + int(r), left + int(c)
+        return float(scores[r, c]), row, col
+
+
+def clip_region(region, shape):
+    """把 (left, top, width, height) 限制在图像范围内"""
+    left, top, width, height = (int(v) for v in region)
+    right = min(left + width, shape[1])
+    bottom = min(top + height, shape[0])
+    left = min(max(left, 0), shape[1])
+    top = min(max(top, 0), shape[0])
+    return left, top, max(0, right - left), max(0, bottom - top)
+
+
+def crop_frame(pixels, region, left=0, top=0):
+    """
+    从左上角位于 (left, top) 的图像中裁剪出屏幕区域 region
+
+    返回 (图像, 左, 上)，图像是原数组的视图，(左, 上) 为裁剪结果在屏幕上的位置。
+    """
+    if region is None:
+        return pixels, left, top
+    x, y, width, height = clip_region((region[0] - left, region[1] - top, region[2], region[3]), pixels.shape)
+    return pixels[y:y + height, x:x + width], left + x, top + y
+
+
+class LocationMemory:
+    """
+    记住每个模板上次找到的位置
+
+    下次查找时先在上次位置附近的小窗口内匹配，找不到再搜索整个区域。
+    界面元素通常不会移动，这样大多数查找只需处理很小的一块图像。
+    """
+
+    def __init__(self, matcher, margin=48):
+        self.matcher = matcher
+        self.margin = margin  # 小窗口在模板四周额外留出的像素
+        self._positions = {}  # 模板键 -> 上次找到时的左上角坐标
+        self.hits = 0  # 在小窗口内找到的次数
+        self.misses = 0  # 小窗口内未找到、改为全区域搜索的次数
+
+    def locate(self, source, template, key, region=None, confidence=None):
+        """
+        查找模板，返回 Match 或 None；key 用于区分不同模板（如图片路径）
+
+        source 可以是图像数组，也可以是 FrameGrabber（按需截取屏幕区域）。
+        """
+        template = self.matcher.prepare(template)
+        if key in self._positions:
+            window = self.hint_window(template, key, region)
+            if window is not None:
+                match = self._search(source, template, window, confidence)
+                if match is not None:
+                    self.hits += 1
+                    self._positions[key] = (match.left, match.top)
+                    return match
+            self.misses += 1
+
+        match = self._search(source, template, region, confidence)
+        if match is not None:
+            self._positions[key] = (match.left, match.top)
+        else:
+            self._positions.pop(key, None)
+        return match
+
+    def hint_window(self, template, key, region=None):
+        """模板上次出现位置附近的小窗口（限制在 region 之内），没有记录或不相交时返回 None"""
+        position = self._positions.get(key)
+        if position is None:
+            return None
+        template = self.matcher.prepare(template)
+        window = (position[0] - self.margin, position[1] - self.margin,
+                  template.width + 2 * self.margin, template.height + 2 * self.margin)
+        if region is not None:
+            window = intersect_regions(window, region)
+        return window
+
+    def _search(self, source, template, region, confidence):
+        if not hasattr(source, 'grab'):
+            return self.matcher.match(source, template, region=region, confidence=confidence)
+        # 截图来源只截取（或从共享截图中裁剪出）需要的区域
+        pixels, left, top = source.grab(region)
+        match = self.matcher.match(pixels, template, confidence=confidence)
+        if match is not None:
+            match.left += left
+            match.top += top
+        return match
+
+    def forget(self, key=None):
+        """清除某个模板（或全部模板）记住的位置"""
+        if key is None:
+            self._positions.clear()
+        else:
+            self._positions.pop(key, None)
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"位置提示命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {rate:.1f}%）"
+
+
+def intersect_regions(a, b):
+    """两个 (left, top, width, height) 区域的交集，不相交时返回 None"""
+    left = max(a[0], b[0])
+    top = max(a[1], b[1])
+    right = min(a[0] + a[2], b[0] + b[2])
+    bottom = min(a[1] + a[3], b[1] + b[3])
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+class FrameGrabber:
+    """
+    共享的屏幕截图
+
+    在 max_age 秒内的多次查找共用同一张截图，不再每次查找都截取整个屏幕。
+    执行点击、按键、滚动等操作后应调用 invalidate()，下次查找时重新截图。
+    只需要一个区域时可以只截取该区域。
+    """
+
+    def __init__(self, capture, max_age=0.1, clock=time.monotonic):
+        self.capture = capture  # capture(region) -> 图像；region 为 None 时截取整个屏幕
+        self.max_age = max_age
+        self.clock = clock
+        self._full = None  # (截取时间, 整屏图像)
+        self._partial = None  # (截取时间, 区域图像, 左, 上)
+        self.captures = 0  # 实际截图次数
+        self.reuses = 0  # 复用已有截图的次数
+
+    def grab(self, region=None):
+        """返回 (图像, 左, 上)：覆盖 region（为 None 时为整个屏幕）的图像及其在屏幕上的位置"""
+        now = self.clock()
+        if self._full is not None and now - self._full[0] <= self.max_age:
+            self.reuses += 1
+            return crop_frame(self._full[1], region)
+
+        if region is None:
+            pixels = np.asarray(self.capture(None))
+            self._full = (now, pixels)
+            self._partial = None
+            self.captures += 1
+            return pixels, 0, 0
+
+        # 屏幕左上角之外的部分截不到，区域从 (0, 0) 开始截取
+        left, top, width, height = (int(v) for v in region)
+        x, y = max(left, 0), max(top, 0)
+        width, height = width - (x - left), height - (y - top)
+        if self._partial is not None and now - self._partial[0] <= self.max_age:
+            _, pixels, cached_x, cached_y = self._partial
+            if cached_x <= x and cached_y <= y and x + width <= cached_x + pixels.shape[1] and \
+                    y + height <= cached_y + pixels.shape[0]:
+                self.reuses += 1
+                return crop_frame(pixels, region, cached_x, cached_y)
+
+        pixels = np.asarray(self.capture((x, y, width, height)))
+        self._partial = (now, pixels, x, y)
+        self.captures += 1
+        return pixels, x, y
+
+    def invalidate(self):
+        """屏幕可能已经变化，丢弃已有截图"""
+        self._full = None
+        self._partial = None
+
+    def reset_counters(self):
+        self.captures = 0
+        self.reuses = 0
+
+    def summary(self):
+        return f"截图 {self.captures} 次，复用截图 {self.reuses} 次"
+
+
+def frame_signature(pixels, step=8):
+    """
+    按 step x step 分块求平均灰度得到的缩略图，用于低成本地判断屏幕是否变化
+
+    每个像素都计入所在块的平均值（边缘不足 step 的块按实际像素数平均），
+    比隔点取样多花一次灰度转换，但不会漏掉落在取样点之间的小图标或细线。
+    """
+    gray = to_gray(pixels)
+    if gray.size == 0:
+        return gray
+    rows = np.arange(0, gray.shape[0], step)
+    cols = np.arange(0, gray.shape[1], step)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(rows, append=gray.shape[0]), np.diff(cols, append=gray.shape[1]))
+    return sums / counts
+
+
+class ImageWaiter:
+    """
+    等待模板图片出现
+
+    每次检查先比较缩略图，画面（或指定区域）没有变化时不做模板匹配。
+    模板有位置记录时只截取和比较上次位置附近的小窗口（见 LocationMemory.hint_window），
+    窗口内找不到、位置记录被清除后才截取整个区域；屏幕其他地方的变化（时钟、光标、日志等）
+    不会触发匹配。画面一直不变时检查间隔按 backoff 倍数逐渐拉长，直到 max_interval；
+    一旦画面变化，间隔恢复为 min_interval。缩略图看不出的变化（只改动一两个像素等）也不会一直被忽略：
+    距上次匹配超过 rematch_interval 秒时，不论缩略图是否变化都做一次匹配。
+    """
+
+    def __init__(self, locator, grabber, min_interval=0.02, max_interval=0.05, backoff=1.5, step=8,
+                 threshold=2.0, rematch_interval=0.5, sleep=time.sleep, clock=time.monotonic):
+        self.locator = locator  # LocationMemory
+        self.grabber = grabber  # FrameGrabber
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.step = step  # 缩略图分块大小（像素）
+        self.threshold = threshold  # 缩略图中任一块的平均灰度变化超过此值即视为画面变化
+        self.rematch_interval = rematch_interval  # 画面看起来没变时，至少每隔这么久做一次匹配
+        self.sleep = sleep
+        self.clock = clock
+        self.polls = 0  # 检查画面的次数
+        self.matches = 0  # 实际做模板匹配的次数
+
+    def wait(self, template, key, region=None, timeout=None, should_continue=None):
+        """
+        等待模板出现，返回 Match；超时或 should_continue() 返回 False 时返回 None
+
+        timeout 为 None 时一直等待。第一次检查总会做一次匹配。
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        interval = self.min_interval
+        previous = None
+        last_match = None
+        while True:
+            watch = self.locator.hint_window(template, key, region)
+            self.grabber.invalidate()
+            pixels, _, _ = self.grabber.grab(watch if watch is not None else region)
+            self.polls += 1
+            now = self.clock()
+            signature = frame_signature(pixels, self.step)
+            changed = previous is None or signature.shape != previous.shape or \
+                np.abs(signature - previous).max() > self.threshold
+            if changed or now - last_match >= self.rematch_interval:
+                # 画面有变化（或很久没有匹配）：先在刚截取的窗口内匹配，找不到时才截取整个区域
+                self.matches += 1
+                last_match = now
+                match = self.locator.locate(self.grabber, template, key, region=region)
+                if match is not None:
+                    return match
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+            previous = signature
+
+            if should_continue is not None and not should_continue():
+                return None
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return None
+                interval = min(interval, remaining)
+            self.sleep(interval)
+
+    def reset_counters(self):
+        self.polls = 0
+        self.matches = 0
+
+    def summary(self):
+        return f"等待图片时检查画面 {self.polls} 次，其中 {self.matches} 次做了模板匹配"
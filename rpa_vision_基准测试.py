@@ -0,0 +1,185 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from rpa_vision import LocationMemory, TemplateMatcher
+
+
+def draw_glyphs(frame, left, top, width, height, rng, color):
+    """在按钮内画几行随机笔画，模拟文字"""
+    x = left + 6
+    while x < left + width - 10:
+        glyph_width = int(rng.integers(4, 9))
+        for _ in range(int(rng.integers(2, 5))):
+            if rng.random() < 0.5:
+                # 横笔画
+                y = top + int(rng.integers(height // 4, height * 3 // 4))
+                frame[y, x:x + glyph_width] = color
+            else:
+                # 竖笔画
+                cx = x + int(rng.integers(0, glyph_width))
+                frame[top + height // 4:top + height * 3 // 4, cx] = color
+        x += glyph_width + int(rng.integers(2, 4))
+
+
+def make_ui_frame(seed=0, width=1920, height=1080):
+    """
+    生成可复现的合成界面截图
+
+    大面积纯色背景和面板、许多外观相同的空白按钮（背景不唯一），以及带随机"文字"的按钮。
+
+    Returns:
+        (RGB 图像, 带文字的按钮列表 [(左, 上, 宽, 高)])
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = (240, 240, 240)
+    # 标题栏、侧边栏和几块面板
+    frame[:40] = (45, 90, 160)
+    frame[40:, :260] = (225, 228, 232)
+    for left, top, w, h in ((300, 80, 700, 420), (1040, 80, 820, 420), (300, 540, 1560, 500)):
+        frame[top:top + h, left:left + w] = (250, 250, 250)
+        frame[top, left:left + w] = frame[top + h - 1, left:left + w] = (200, 200, 200)
+        frame[top:top + h, left] = frame[top:top + h, left + w - 1] = (200, 200, 200)
+
+    buttons = []
+    # 网格排列的按钮：约一半是相同的空白按钮，另一半带不同的文字
+    for row in range(12):
+        for col in range(14):
+            left = 320 + col * 110
+            top = 560 + row * 38
+            if left + 90 > 1850 or top + 30 > 1030:
+                continue
+            frame[top:top + 30, left:left + 90] = (230, 232, 236)
+            frame[top, left:left + 90] = frame[top + 29, left:left + 90] = (170, 170, 175)
+            frame[top:top + 30, left] = frame[top:top + 30, left + 89] = (170, 170, 175)
+            if rng.random() < 0.5:
+                draw_glyphs(frame, left, top, 90, 30, rng, (30, 30, 30))
+                buttons.append((left, top, 90, 30))
+    # 侧边栏中的菜单项
+    for i in range(12):
+        top = 80 + i * 60
+        frame[top:top + 40, 20:240] = (215, 218, 222)
+        draw_glyphs(frame, 20, top, 220, 40, rng, (20, 20, 20))
+        buttons.append((20, top, 220, 40))
+    return frame, buttons
+
+
+# 从按钮中裁出的小模板（高, 宽, 在按钮内的上, 左）：单行文字、小图标
+SMALL_TEMPLATES = ((12, 40, 9, 25), (15, 15, 8, 30), (16, 16, 7, 40), (20, 20, 5, 50), (24, 24, 3, 6))
+
+
+def make_noise_frame(seed=0, width=1920, height=1080):
+    """随机噪声截图（每个 2x2 块同一颜色），每个位置都不同，用来检查小模板的区分度"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(height // 2, width // 2, 3), dtype=np.uint8)
+    return np.repeat(np.repeat(blocks, 2, axis=0), 2, axis=1)
+
+
+class _Checker:
+    """累计查找次数、失败记录和各类模板的耗时"""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.checked = 0
+        self.missed = 0
+        self.wrong = 0
+        self.times_ms = {}  # 模板类别 -> [耗时]
+        self.failures = []
+
+    def check(self, kind, frame, left, top, w, h, seed, timed=True):
+        """查找 frame 中 (left, top, w, h) 处的内容；找到完全相同的另一处也算正确"""
+        template = frame[top:top + h, left:left + w].copy()
+        prepared = self.matcher.prepare(template)
+        start = time.perf_counter()
+        match = self.matcher.match(frame, prepared)
+        if timed:
+            self.times_ms.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+        self.checked += 1
+        if match is None:
+            self.missed += 1
+            self.failures.append({"kind": kind, "seed": seed, "region": [left, top, w, h], "found": None})
+        elif (match.left, match.top) != (left, top) and \
+                not np.array_equal(frame[match.top:match.top + h, match.left:match.left + w], template):
+            self.wrong += 1
+            self.failures.append({"kind": kind, "seed": seed, "region": [left, top, w, h],
+                                  "found": [match.left, match.top], "score": match.score})
+
+
+def run_check(seeds=3, templates=30, confidence=0.8):
+    """
+    在合成截图上查找模板，记录找错和找不到的次数与各类模板的耗时
+
+    每张界面截图随机选 templates 个带文字的按钮，查找整个按钮和从中裁出的小模板（SMALL_TEMPLATES）；
+    再加上两个纯色模板（应找到同样颜色的区域）和一次内容已变化的位置提示。
+    噪声截图上查找同样尺寸的随机位置。
+    """
+    matcher = TemplateMatcher(confidence=confidence)
+    checker = _Checker(matcher)
+    for seed in range(seeds):
+        frame, buttons = make_ui_frame(seed)
+        rng = np.random.default_rng(1000 + seed)
+        picks = rng.choice(len(buttons), size=min(templates, len(buttons)), replace=False)
+        for index in picks:
+            left, top, w, h = buttons[int(index)]
+            checker.check(f"button {w}x{h}", frame, left, top, w, h, seed)
+            for small_h, small_w, dy, dx in SMALL_TEMPLATES:
+                if dy + small_h <= h and dx + small_w <= w:
+                    checker.check(f"ui {small_w}x{small_h}", frame, left + dx, top + dy, small_w, small_h, seed)
+
+        # 纯色模板：只要找到的区域颜色相同即可
+        for left, top, w, h in ((400, 200, 60, 40), (700, 300, 120, 60)):
+            checker.check("flat", frame, left, top, w, h, seed, timed=False)
+
+        # 位置提示：按钮内容换成空白后，提示窗口内不应误报
+        memory = LocationMemory(matcher)
+        left, top, w, h = buttons[0]
+        template = matcher.prepare(frame[top:top + h, left:left + w].copy())
+        memory.locate(frame, template, "button")
+        changed = frame.copy()
+        changed[top + 1:top + h - 1, left + 1:left + w - 1] = (230, 232, 236)
+        match = memory.locate(changed, template, "button")
+        checker.checked += 1
+        if match is not None:
+            checker.wrong += 1
+            checker.failures.append({"kind": "hint", "seed": seed, "region": [left, top, w, h],
+                                     "found": [match.left, match.top], "score": match.score})
+
+        noise = make_noise_frame(seed)
+        for _ in range(max(1, templates // 5)):
+            for h, w in ((12, 40), (15, 15), (16, 16), (20, 20), (24, 24), (30, 90)):
+                left = int(rng.integers(0, noise.shape[1] - w))
+                top = int(rng.integers(0, noise.shape[0] - h))
+                checker.check(f"noise {w}x{h}", noise, left, top, w, h, seed)
+    return {"checked": checker.checked, "missed": checker.missed, "wrong": checker.wrong,
+            "times_ms": checker.times_ms, "failures": checker.failures}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模板匹配的正确性检查和基准测试：在合成界面截图上查找按钮")
+    parser.add_argument("--seeds", type=int, default=3, help="合成截图的数量（默认 3）")
+    parser.add_argument("--templates", type=int, default=30, help="每张截图查找的按钮数（默认 30）")
+    parser.add_argument("--confidence", type=float, default=0.8, help="匹配度阈值（默认 0.8）")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = run_check(seeds=args.seeds, templates=args.templates, confidence=args.confidence)
+    print(f"检查 {results['checked']} 次，找不到 {results['missed']} 次，找错位置 {results['wrong']} 次")
+    print("单次查找整个截图（1920x1080）的耗时:")
+    for kind, times in sorted(results["times_ms"].items()):
+        times = sorted(times)
+        print(f"  {kind:<14} {len(times):>4} 次  中位数 {times[len(times) // 2]:6.1f} 毫秒  "
+              f"最长 {times[-1]:6.1f} 毫秒")
+    for failure in results["failures"]:
+        print(f"  失败: {failure}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if results["missed"] or results["wrong"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,1704 @@
+import argparse
+import csv
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import math
+import mmap
 import os
+import queue
+import re
+import select
+import sqlite3
+import stat
+import struct
 import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+try:
+    import numpy as np  # 可选：用于大结果集的快速索引排序
+except ImportError:
+    np = None
 
-def get_file_size(file_path):
-    """获取文件大小，处理权限错误"""
+try:
+    import zstandard  # 可选：报告的 zstd 压缩
+except ImportError:
+    zstandard = None
+
+
+class ScanIndex:
+    """
+    持久化的增量扫描索引（SQLite）
+
+    为每个目录记录其 mtime 以及目录内各文件的大小和子目录名。再次扫描时，mtime 未变化的目录
+    直接复用索引中的记录而不重新列出；只有 mtime 变化（增删或重命名了条目）的目录才会重新列出。
+    注意：原地修改文件内容不会改变目录的 mtime，这类文件的大小会沿用上次的记录，
+    需要精确结果时请强制完整重扫。
+
+    可被多个遍历线程共享，所有数据库操作都在内部加锁。
+
+    Args:
+        db_path: 索引文件路径
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                id INTEGER PRIMARY KEY,
+                path BLOB NOT NULL UNIQUE,
+                mtime_ns INTEGER NOT NULL,
+                scan_id INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                dir_id INTEGER NOT NULL,
+                name BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                is_dir INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_dir_id ON entries (dir_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        row = self._conn.execute("SELECT MAX(scan_id) FROM dirs").fetchone()
+        self.scan_id = (row[0] or 0) + 1
+        self._hit_ids = []
+
+    def check_filter(self, signature):
+        """
+        检查索引是否由相同的过滤规则建立，并记录本次的规则
+
+        索引中缓存的是过滤后的目录内容，规则变化后必须重新列出所有目录。
+
+        Returns:
+            规则相同返回 True
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'filter'").fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('filter', ?)", (signature,))
+        return row is not None and row[0] == signature
+
+    def lookup(self, dir_path, mtime_ns):
+        """
+        查询目录的缓存记录
+
+        Returns:
+            mtime 一致时返回 (文件列表 [(文件名, 大小)], 子目录名列表)，否则返回 None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT id, mtime_ns FROM dirs WHERE path = ?",
+                                     (os.fsencode(dir_path),)).fetchone()
+            if row is None or row[1] != mtime_ns:
+                return None
+            rows = self._conn.execute("SELECT name, size, is_dir FROM entries WHERE dir_id = ?",
+                                      (row[0],)).fetchall()
+            self._hit_ids.append((self.scan_id, row[0]))
+
+        files = []
+        subdir_names = []
+        for name, size, is_dir in rows:
+            if is_dir:
+                subdir_names.append(os.fsdecode(name))
+            else:
+                files.append((os.fsdecode(name), size))
+        return files, subdir_names
+
+    def store(self, dir_path, mtime_ns, files, subdir_names):
+        """记录一个完整列出的目录"""
+        rows = [(os.fsencode(name), size, 0) for name, size in files]
+        rows.extend((os.fsencode(name), 0, 1) for name in subdir_names)
+
+        with self._lock:
+            conn = self._conn
+            path = os.fsencode(dir_path)
+            row = conn.execute("SELECT id FROM dirs WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                dir_id = conn.execute("INSERT INTO dirs (path, mtime_ns, scan_id) VALUES (?, ?, ?)",
+                                      (path, mtime_ns, self.scan_id)).lastrowid
+            else:
+                dir_id = row[0]
+                conn.execute("UPDATE dirs SET mtime_ns = ?, scan_id = ? WHERE id = ?",
+                             (mtime_ns, self.scan_id, dir_id))
+                conn.execute("DELETE FROM entries WHERE dir_id = ?", (dir_id,))
+            conn.executemany("INSERT INTO entries (dir_id, name, size, is_dir) VALUES (?, ?, ?, ?)",
+                             ((dir_id,) + r for r in rows))
+
+    def finish(self, root_path, completed):
+        """
+        提交本次扫描
+
+        扫描完整结束时，删除 root_path 之下本次没有访问到的目录（已被删除或不再可达）。
+        """
+        with self._lock:
+            conn = self._conn
+            conn.executemany("UPDATE dirs SET scan_id = ? WHERE id = ?", self._hit_ids)
+            self._hit_ids = []
+
+            if completed:
+                root = os.fsencode(root_path)
+                prefix = os.fsencode(os.path.join(root_path, ''))
+                stale = [(dir_id,) for dir_id, path in
+                         conn.execute("SELECT id, path FROM dirs WHERE scan_id != ?", (self.scan_id,))
+                         if path == root or path.startswith(prefix)]
+                conn.executemany("DELETE FROM entries WHERE dir_id = ?", stale)
+                conn.executemany("DELETE FROM dirs WHERE id = ?", stale)
+            conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class ScanMetrics:
+    """
+    扫描过程的性能和错误统计
+
+    记录各阶段耗时（列目录、取文件大小、排序、写报告等）、随时间变化的文件/目录扫描速度，
+    以及按 errno 分类的错误数和示例路径，可在运行结束时导出为 JSON。
+    可被多个遍历线程共享；并发遍历时“list”和“stat”阶段的耗时是各线程耗时之和。
+
+    Args:
+        sample_interval: 扫描速度的采样间隔（秒）
+        max_error_samples: 每种错误保留的示例路径数
+    """
+
+    def __init__(self, sample_interval=1.0, max_error_samples=5):
+        self.sample_interval = sample_interval
+        self.max_error_samples = max_error_samples
+        self._lock = threading.Lock()
+
+        self.phases = {}
+        self.samples = []
+        self.errors = {}
+        self.totals = {}
+
+    def add_time(self, phase, seconds):
+        """累加某个阶段的耗时"""
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def phase(self, name):
+        """计时上下文：with metrics.phase('sort'): ..."""
+        return _PhaseTimer(self, name)
+
+    def record_errors(self, errors):
+        """记录 [(路径, OSError)]"""
+        with self._lock:
+            for path, error in errors:
+                if error.errno is not None:
+                    key = errno.errorcode.get(error.errno, str(error.errno))
+                else:
+                    key = type(error).__name__
+                item = self.errors.setdefault(key, {"count": 0, "samples": []})
+                item["count"] += 1
+                if len(item["samples"]) < self.max_error_samples:
+                    item["samples"].append(path)
+
+    def sample(self, elapsed, file_count, dir_count):
+        """记录一个扫描速度采样点"""
+        self.samples.append((elapsed, file_count, dir_count))
+
+    def record_totals(self, scanner):
+        """扫描结束时记录总量"""
+        elapsed = scanner.elapsed
+        self.totals = {
+            "files": scanner.file_count,
+            "dirs": scanner.dir_count,
+            "errors": scanner.error_count,
+            "elapsed": elapsed,
+            "files_per_sec": scanner.file_count / elapsed if elapsed > 0 else 0.0,
+            "dirs_per_sec": scanner.dir_count / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def to_dict(self):
+        throughput = []
+        prev_t = prev_files = prev_dirs = 0
+        for t, files, dirs in self.samples:
+            dt = t - prev_t
+            throughput.append({
+                "t": round(t, 3),
+                "files": files,
+                "dirs": dirs,
+                "files_per_sec": (files - prev_files) / dt if dt > 0 else 0.0,
+                "dirs_per_sec": (dirs - prev_dirs) / dt if dt > 0 else 0.0,
+            })
+            prev_t, prev_files, prev_dirs = t, files, dirs
+        return {
+            "totals": self.totals,
+            "phases": self.phases,
+            "throughput": throughput,
+            "errors": self.errors,
+        }
+
+    def save_json(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+class _PhaseTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class ScanFilter:
+    """
+    遍历时的剪枝规则
+
+    规则在列出目录时就生效：被排除的目录不会被列出，被排除的文件不会取大小。
+        exclude: 排除的通配符模式，同时作用于目录和文件。不含路径分隔符的模式匹配名称
+                 （如 ".git"、"node_modules"、"*.tmp"），含分隔符的模式匹配相对扫描根目录的路径
+                 （如 "build/*/cache"，统一使用 "/" 作分隔符）
+        include: 只保留匹配的文件（规则同上），为空时保留所有文件；不影响进入哪些目录
+        min_size: 小于该字节数的文件不计入结果
+        one_file_system: 不进入与扫描根目录不在同一文件系统（st_dev 不同）的目录，
+                         可跳过 /proc 等虚拟文件系统和其他挂载的设备
+    """
+
+    def __init__(self, exclude=(), include=(), min_size=0, one_file_system=False):
+        self.exclude = list(exclude)
+        self.include = list(include)
+        self.min_size = min_size
+        self.one_file_system = one_file_system
+
+        self._exclude_name, self._exclude_path = self._compile(self.exclude)
+        self._include_name, self._include_path = self._compile(self.include)
+        self._root_prefix_len = 0
+        self._root_dev = None
+
+    @staticmethod
+    def _compile(patterns):
+        """把模式分成按名称匹配和按相对路径匹配两组，各自合并为一个正则表达式"""
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        name_patterns = []
+        path_patterns = []
+        for pattern in patterns:
+            pattern = pattern.replace(os.sep, '/')
+            (path_patterns if '/' in pattern.strip('/') else name_patterns).append(pattern.strip('/'))
+
+        def combine(items):
+            if not items:
+                return None
+            return re.compile('|'.join(fnmatch.translate(item) for item in items), flags)
+
+        return combine(name_patterns), combine(path_patterns)
+
+    @property
+    def signature(self):
+        """规则的文本表示，用于判断增量索引是否仍然有效"""
+        return json.dumps([self.exclude, self.include, self.min_size, self.one_file_system])
+
+    def prepare(self, root_path):
+        """绑定扫描根目录"""
+        self._root_prefix_len = len(os.path.join(root_path, ''))
+        self._root_dev = os.stat(root_path).st_dev if self.one_file_system else None
+
+    def _relative(self, path):
+        rel = path[self._root_prefix_len:]
+        return rel.replace(os.sep, '/') if os.sep != '/' else rel
+
+    def _matches(self, entry, name_regex, path_regex):
+        if name_regex is not None and name_regex.match(entry.name):
+            return True
+        return path_regex is not None and path_regex.match(self._relative(entry.path)) is not None
+
+    def accept_dir(self, entry):
+        """是否进入该目录"""
+        if self._matches(entry, self._exclude_name, self._exclude_path):
+            return False
+        if self._root_dev is not None:
+            # Windows 上 DirEntry.stat() 不提供 st_dev，需要单独 stat
+            st = os.lstat(entry.path) if os.name == 'nt' else entry.stat(follow_symlinks=False)
+            if st.st_dev != self._root_dev:
+                return False
+        return True
+
+    def accept_file(self, entry):
+        """是否保留该文件（只按名称判断，大小由调用方比较 min_size）"""
+        if self._matches(entry, self._exclude_name, self._exclude_path):
+            return False
+        if self._include_name is None and self._include_path is None:
+            return True
+        return self._matches(entry, self._include_name, self._include_path)
+
+
+class FileScanner:
+    """
+    基于 os.scandir 的目录遍历器
+
+    每个文件的大小直接取自 DirEntry.stat() 的缓存结果（Windows 上无需额外系统调用，
+    Linux 上也只有一次 stat），目录路径在同一目录内的所有文件间共享，不为每个文件重新拼接。
+    可直接作为生成器使用，在遍历进行中逐条取得 (路径, 大小) 记录。
+
+    workers 大于 1 时启用并发遍历：多个工作线程从共享队列中领取目录并列出其内容，
+    适合 NFS/SMB 等高延迟文件系统或队列深度较大的 NVMe 磁盘。结果集合与单线程遍历相同，
+    只是顺序不同。
+
+    指定 index 时进行增量扫描：mtime 未变化的目录直接复用索引中的记录，见 ScanIndex。
+
+    Args:
+        target_path: 要扫描的目录
+        workers: 遍历线程数，1 表示单线程遍历
+        progress: 进度回调，每扫描 progress_interval 个文件调用一次 progress(scanner)
+        progress_interval: 进度回调的文件间隔
+        index: ScanIndex 增量扫描索引，为 None 时不使用索引
+        rescan: 为 True 时忽略索引中的缓存记录，重新列出所有目录并刷新索引
+        metrics: ScanMetrics，记录耗时、扫描速度和错误明细，为 None 时不记录
+        scan_filter: ScanFilter 剪枝规则，为 None 时扫描所有文件
+    """
+
+    def __init__(self, target_path, workers=1, progress=None, progress_interval=10000,
+                 index=None, rescan=False, metrics=None, scan_filter=None):
+        # 索引按绝对路径记录目录
+        self.target_path = os.path.abspath(target_path) if index is not None else target_path
+        self.workers = max(1, int(workers))
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.index = index
+        self.rescan = rescan
+        self.metrics = metrics
+        self.scan_filter = scan_filter
+
+        # 计数器
+        self.file_count = 0
+        self.dir_count = 0
+        self.reused_dir_count = 0
+        self.error_count = 0
+        self.start_time = None
+
+    @property
+    def elapsed(self):
+        """已用时间（秒）"""
+        if self.start_time is None:
+            return 0.0
+        return time.perf_counter() - self.start_time
+
+    @property
+    def files_per_second(self):
+        """平均扫描速度（文件/秒）"""
+        elapsed = self.elapsed
+        return self.file_count / elapsed if elapsed > 0 else 0.0
+
+    def __iter__(self):
+        prefix_dir = prefix = None
+        for dir_path, name, size in self.scan_entries():
+            # 每个目录只拼接一次前缀
+            if dir_path is not prefix_dir:
+                prefix_dir = dir_path
+                prefix = os.path.join(dir_path, '')
+            yield prefix + name, size
+
+    def scan_entries(self):
+        """
+        遍历目录树，逐条产出 (所在目录, 文件名, 文件大小)
+
+        同一目录下的记录共享同一个目录字符串对象，调用方可据此按目录聚合而不必拆分路径。
+        计数器只在调用方所在线程中更新，并发模式下也无需加锁读取。
+        """
+        self.start_time = time.perf_counter()
+        if self.scan_filter is not None:
+            self.scan_filter.prepare(self.target_path)
+        if self.index is not None:
+            signature = self.scan_filter.signature if self.scan_filter is not None else ""
+            if not self.index.check_filter(signature):
+                self.rescan = True
+        listings = self._walk_parallel() if self.workers > 1 else self._walk_serial()
+        metrics = self.metrics
+        next_sample = 0.0
+
+        completed = False
+        try:
+            for dir_path, files, errors, reused in listings:
+                if errors:
+                    self.error_count += len(errors)
+                    if metrics is not None:
+                        metrics.record_errors(errors)
+                if metrics is not None and self.elapsed >= next_sample:
+                    metrics.sample(self.elapsed, self.file_count, self.dir_count)
+                    next_sample = self.elapsed + metrics.sample_interval
+                if files is None:
+                    continue
+                self.dir_count += 1
+                self.reused_dir_count += reused
+
+                for name, size in files:
+                    self.file_count += 1
+                    if self.progress is not None and self.file_count % self.progress_interval == 0:
+                        self.progress(self)
+                    yield dir_path, name, size
+            completed = True
+        finally:
+            if metrics is not None:
+                metrics.sample(self.elapsed, self.file_count, self.dir_count)
+                metrics.record_totals(self)
+            if self.index is not None:
+                self.index.finish(self.target_path, completed)
+
+    def _visit_dir(self, dir_path):
+        """
+        取得单个目录的内容，有索引时优先复用缓存记录
+
+        Returns:
+            (文件列表, 子目录路径列表, 错误列表, 是否复用了索引)
+        """
+        if self.index is None:
+            return self._list_dir(dir_path) + (False,)
+
+        # 先取 mtime 再列出目录：列出期间发生的变化会在下次扫描时被发现
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError as e:
+            return None, [], [(dir_path, e)], False
+
+        if not self.rescan:
+            cached = self.index.lookup(dir_path, mtime_ns)
+            if cached is not None:
+                files, subdir_names = cached
+                return files, [os.path.join(dir_path, name) for name in subdir_names], [], True
+
+        files, subdirs, errors = self._list_dir(dir_path)
+        # 只缓存完整列出的目录，否则出错的条目会一直缺失到目录下次变化
+        if files is not None and not errors:
+            self.index.store(dir_path, mtime_ns, files, [os.path.basename(p) for p in subdirs])
+        return files, subdirs, errors, False
+
+    def _list_dir(self, dir_path):
+        """
+        列出单个目录
+
+        Returns:
+            (文件列表 [(文件名, 大小)], 子目录路径列表, 错误列表 [(路径, OSError)])；
+            目录无法打开时文件列表为 None
+        """
+        files = []
+        subdirs = []
+        errors = []
+        timed = self.metrics is not None
+        clock = time.perf_counter
+        scan_filter = self.scan_filter
+        min_size = scan_filter.min_size if scan_filter is not None else 0
+        start = clock() if timed else 0.0
+        stat_time = 0.0
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        # 与 os.walk 一致：指向目录的符号链接视为目录但不进入
+                        if entry.is_dir():
+                            if not entry.is_symlink() and (scan_filter is None or scan_filter.accept_dir(entry)):
+                                subdirs.append(entry.path)
+                            continue
+                        if scan_filter is not None and not scan_filter.accept_file(entry):
+                            continue
+                        if timed:
+                            t = clock()
+                            size = entry.stat().st_size
+                            stat_time += clock() - t
+                        else:
+                            size = entry.stat().st_size
+                        if size >= min_size:
+                            files.append((entry.name, size))
+                    except OSError as e:
+                        errors.append((entry.path, e))
+        except OSError as e:
+            errors.append((dir_path, e))
+            if not files and not subdirs:
+                files = None
+        if timed:
+            self.metrics.add_time('list', clock() - start - stat_time)
+            self.metrics.add_time('stat', stat_time)
+        return files, subdirs, errors
+
+    def _walk_serial(self):
+        """单线程深度优先遍历，逐个产出 (目录, 文件列表, 错误数, 是否复用索引)"""
+        stack = [self.target_path]
+        while stack:
+            dir_path = stack.pop()
+            files, subdirs, errors, reused = self._visit_dir(dir_path)
+            stack.extend(subdirs)
+            yield dir_path, files, errors, reused
+
+    def _walk_parallel(self):
+        """多线程遍历，逐个产出 (目录, 文件列表, 错误数, 是否复用索引)，产出顺序不确定"""
+        dir_queue = queue.Queue()
+        # 结果队列有上限：调用方处理得慢时工作线程等待，积压的文件列表不超过几倍线程数个目录
+        result_queue = queue.Queue(maxsize=4 * self.workers)
+        stop = threading.Event()
+        finished = threading.Event()
+
+        def submit(item):
+            # 调用方提前停止迭代后不再有人取结果，不能一直等待
+            while not finished.is_set():
+                try:
+                    result_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    dir_path = dir_queue.get()
+                    if dir_path is None:
+                        break
+                    files, subdirs, errors, reused = self._visit_dir(dir_path)
+                    # 先把子目录放入队列再提交结果，保证主线程的待处理计数不会提前归零
+                    for subdir in subdirs:
+                        dir_queue.put(subdir)
+                    submit((dir_path, files, errors, reused, len(subdirs)))
+            except BaseException as e:
+                # OSError 已在 _list_dir 中处理；其他异常（索引数据库被锁定、内存不足等）
+                # 交给主线程重新抛出，否则待处理计数永远不会归零
+                stop.set()
+                submit(e)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        dir_queue.put(self.target_path)
+        pending = 1
+        try:
+            while pending:
+                # 带超时等待，使 Ctrl+C 在 Windows 上也能及时打断
+                try:
+                    item = result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if isinstance(item, BaseException):
+                    raise item
+                dir_path, files, errors, reused, subdir_count = item
+                pending += subdir_count - 1
+                yield dir_path, files, errors, reused
+        finally:
+            # 正常结束、用户中断或调用方提前停止迭代时都通知工作线程退出
+            stop.set()
+            finished.set()
+            for _ in threads:
+                dir_queue.put(None)
+
+
+class TopFiles:
+    """
+    流式保留最大的 K 个文件
+
+    扫描过程中只维护一个大小为 K 的最小堆，内存占用为 O(K)；文件总数、总大小、
+    最大和最小文件大小对全部文件精确统计。完整路径只为进入堆的文件拼接。
+    结果按文件大小降序迭代为 (路径, 大小)，可直接交给 display_results 和 save_to_file。
+
+    Args:
+        k: 保留的文件个数
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._sorted = None
+
+        # 全部文件的精确统计
+        self.file_count = 0
+        self.total_size = 0
+        self.max_size = 0
+        self.min_size = 0
+
+    def add(self, dir_path, name, size):
+        """加入一个文件"""
+        if self.file_count == 0 or size < self.min_size:
+            self.min_size = size
+        if size > self.max_size:
+            self.max_size = size
+        self.file_count += 1
+        self.total_size += size
+
+        heap = self._heap
+        if len(heap) < self.k:
+            heapq.heappush(heap, (size, dir_path, name))
+            self._sorted = None
+        elif size > heap[0][0]:
+            heapq.heapreplace(heap, (size, dir_path, name))
+            self._sorted = None
+
+    def items(self):
+        """按文件大小降序返回 [(路径, 大小)]"""
+        if self._sorted is None:
+            self._sorted = [(os.path.join(dir_path, name), size)
+                            for size, dir_path, name in sorted(self._heap, reverse=True)]
+        return self._sorted
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+
+class FileTable:
+    """
+    紧凑的列式扫描结果
+
+    文件大小保存在类型化数组中，路径拆成 (所在目录编号, 文件名) 存储：目录字符串只保存一份，
+    文件名以编码后的字节连续存放在一个缓冲区里。每个文件的固定开销约 24 字节加文件名长度，
+    而 (str, int) 元组列表每个文件要 150 字节以上。
+    排序只对索引数组进行，不移动数据本身。迭代和索引访问仍然得到 (路径, 大小)，
+    因此可直接交给 display_results 和 save_to_file。
+    """
+
+    def __init__(self):
+        self.sizes = array('Q')
+        self.dir_ids = array('I')
+        self._name_ends = array('Q')
+        self._names = bytearray()
+        self._prefixes = []
+        self._dir_index = {}
+        self._last_dir = None
+        self._last_dir_id = 0
+        self._order = None
+
+        # 全部文件的统计
+        self.total_size = 0
+        self.max_size = 0
+        self.min_size = 0
+
+    @property
+    def file_count(self):
+        return len(self.sizes)
+
+    def intern_dir(self, dir_path):
+        """返回目录编号，每个目录字符串只保存一次"""
+        if dir_path is self._last_dir:
+            return self._last_dir_id
+        dir_id = self._dir_index.get(dir_path)
+        if dir_id is None:
+            dir_id = len(self._prefixes)
+            self._dir_index[dir_path] = dir_id
+            self._prefixes.append(os.path.join(dir_path, ''))
+        self._last_dir = dir_path
+        self._last_dir_id = dir_id
+        return dir_id
+
+    def add(self, dir_path, name, size):
+        """加入一个文件"""
+        if not self.sizes or size < self.min_size:
+            self.min_size = size
+        if size > self.max_size:
+            self.max_size = size
+        self.total_size += size
+
+        self.sizes.append(size)
+        self.dir_ids.append(self.intern_dir(dir_path))
+        self._names += os.fsencode(name)
+        self._name_ends.append(len(self._names))
+        self._order = None
+
+    def sort_by_size(self):
+        """按文件大小降序排列索引，返回自身"""
+        if np is not None:
+            order = np.argsort(np.frombuffer(self.sizes, dtype=np.uint64), kind='stable')[::-1]
+            self._order = array('I', order.astype(np.uint32).tobytes())
+        else:
+            # 把大小和下标合成一个整数排序，避免额外的键列表
+            keys = sorted(((size << 32) | i for i, size in enumerate(self.sizes)), reverse=True)
+            self._order = array('I', (key & 0xFFFFFFFF for key in keys))
+            del keys
+        return self
+
+    def iter_by_path(self, dir_key=None):
+        """
+        按 (所在目录, 文件名) 升序产出 (所在目录, 文件名, 大小)，不改变当前的大小排序
+
+        目录按 dir_key(目录路径) 排序，默认按目录路径本身。先对目录排序，再按目录顺序
+        对文件编号做计数排序，最后逐个目录按文件名排序：任何时候都只为一个目录生成文件名字符串，
+        不会一次性生成所有文件的完整路径。
+        """
+        dirs = list(self._dir_index)
+        keys = dirs if dir_key is None else [dir_key(dir_path) for dir_path in dirs]
+        dir_order = sorted(range(len(dirs)), key=keys.__getitem__)
+        del keys
+        rank = array('I', bytes(4 * len(dirs)))
+        for position, dir_id in enumerate(dir_order):
+            rank[dir_id] = position
+
+        # 计数排序：starts[r] 为排名 r 的目录在 order 中的起始位置
+        starts = array('Q', bytes(8 * (len(dirs) + 1)))
+        for dir_id in self.dir_ids:
+            starts[rank[dir_id] + 1] += 1
+        for position in range(len(dirs)):
+            starts[position + 1] += starts[position]
+        order = array('I', bytes(4 * len(self.sizes)))
+        fill = array('Q', starts)
+        for row, dir_id in enumerate(self.dir_ids):
+            position = rank[dir_id]
+            order[fill[position]] = row
+            fill[position] += 1
+        del fill, rank
+
+        for position, dir_id in enumerate(dir_order):
+            dir_path = dirs[dir_id]
+            rows = sorted((self.name_at(row), row) for row in order[starts[position]:starts[position + 1]])
+            for name, row in rows:
+                yield dir_path, name, self.sizes[row]
+
+    def name_at(self, row):
+        """按存储位置取文件名"""
+        start = self._name_ends[row - 1] if row else 0
+        return os.fsdecode(bytes(self._names[start:self._name_ends[row]]))
+
+    def path_at(self, row):
+        """按存储位置取完整路径"""
+        return self._prefixes[self.dir_ids[row]] + self.name_at(row)
+
+    def _row(self, index):
+        return self._order[index] if self._order is not None else index
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        rows = self._order if self._order is not None else range(len(self.sizes))
+        for row in rows:
+            yield self.path_at(row), self.sizes[row]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.sizes)))]
+        if index < 0:
+            index += len(self.sizes)
+        if not 0 <= index < len(self.sizes):
+            raise IndexError("FileTable index out of range")
+        row = self._row(index)
+        return self.path_at(row), self.sizes[row]
+
+
+class DirectoryRollup:
+    """
+    按目录汇总的累计大小和文件数（类似 du）
+
+    与扫描同步进行：扫描时只累加每个目录自身直接包含的文件，扫描结束后由 finish 按深度
+    自底向上把子目录的累计值加到父目录，无需第二次遍历。内存占用只与目录数有关。
+    不含任何文件（包括子孙目录中也没有文件）的目录不会出现在结果中。
+    """
+
+    def __init__(self):
+        self.root = None
+        # 目录路径 -> [自身大小, 自身文件数, 累计大小, 累计文件数]
+        self._dirs = {}
+        self._children = {}
+        self._last_dir = None
+        self._last_entry = None
+
+    def add(self, dir_path, name, size):
+        """加入一个文件"""
+        if dir_path is self._last_dir:
+            entry = self._last_entry
+        else:
+            entry = self._dirs.get(dir_path)
+            if entry is None:
+                entry = self._dirs[dir_path] = [0, 0, 0, 0]
+            self._last_dir = dir_path
+            self._last_entry = entry
+        entry[0] += size
+        entry[1] += 1
+
+    def depth(self, dir_path):
+        """目录相对扫描根目录的深度，根目录为 0"""
+        if dir_path == self.root:
+            return 0
+        return dir_path[len(self._root_prefix):].count(os.sep) + 1
+
+    def finish(self, root_path):
+        """扫描结束后自底向上计算各目录的累计值"""
+        self.root = root_path
+        self._root_prefix = os.path.join(root_path, '')
+        if os.altsep:
+            # 统一分隔符后才能按分隔符个数计算深度
+            self._root_prefix = self._root_prefix.replace(os.altsep, os.sep)
+
+        dirs = self._dirs
+        levels = {}
+        for dir_path, entry in dirs.items():
+            entry[2], entry[3] = entry[0], entry[1]
+            levels.setdefault(self.depth(dir_path), []).append(dir_path)
+
+        children = self._children = {}
+        for depth in range(max(levels, default=0), 0, -1):
+            for dir_path in levels.get(depth, ()):
+                # 第一层目录的父目录就是扫描根目录本身（根目录可能带有结尾分隔符）
+                parent = self.root if depth == 1 else os.path.dirname(dir_path)
+                parent_entry = dirs.get(parent)
+                if parent_entry is None:
+                    parent_entry = dirs[parent] = [0, 0, 0, 0]
+                    levels.setdefault(depth - 1, []).append(parent)
+                parent_entry[2] += dirs[dir_path][2]
+                parent_entry[3] += dirs[dir_path][3]
+                children.setdefault(parent, []).append(dir_path)
+        return self
+
+    def get(self, dir_path):
+        """返回目录的 (累计大小, 累计文件数)"""
+        entry = self._dirs.get(dir_path)
+        if entry is None:
+            return 0, 0
+        return entry[2], entry[3]
+
+    def items(self):
+        """产出所有目录的 (路径, 累计大小, 累计文件数)"""
+        for dir_path, entry in self._dirs.items():
+            yield dir_path, entry[2], entry[3]
+
+    def top_dirs(self, n=20, depth=None):
+        """
+        按累计大小返回最大的 n 个目录 [(路径, 累计大小, 累计文件数)]
+
+        Args:
+            n: 返回的目录个数
+            depth: 只统计该深度的目录（根目录为 0），为 None 时统计所有目录
+        """
+        items = self._dirs.items()
+        if depth is not None:
+            items = ((p, e) for p, e in items if self.depth(p) == depth)
+        return [(p, e[2], e[3]) for p, e in heapq.nlargest(n, items, key=lambda item: item[1][2])]
+
+    def children(self, dir_path, n=None):
+        """下钻查询：按累计大小降序返回直接子目录 [(路径, 累计大小, 累计文件数)]"""
+        result = sorted(((p, self._dirs[p][2], self._dirs[p][3]) for p in self._children.get(dir_path, ())),
+                        key=lambda item: item[1], reverse=True)
+        return result[:n] if n is not None else result
+
+
+class SizeSketch:
+    """
+    可合并的分位数草图（DDSketch 思路）
+
+    按对数刻度分桶计数，任意分位数的相对误差不超过 relative_accuracy，
+    内存只与数值跨越的数量级有关。两个草图相加即得到合并数据的草图，可用于合并并发或分批扫描的结果。
+
+    Args:
+        relative_accuracy: 分位数的相对误差上限
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("只能合并精度相同的草图")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        """返回第 q 分位数的估计值（0 <= q <= 1），没有数据时返回 None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # 桶 (gamma^(key-1), gamma^key] 的代表值，相对误差不超过 relative_accuracy
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+class SizeStatistics:
+    """
+    扫描过程中流式更新的文件大小分布统计
+
+    不保存文件列表，可与前 N 名模式、并发遍历和监视以外的任何扫描方式一起作为结果接收者使用：
+        - 精确的文件数、总大小、最大和最小文件
+        - 按 2 的幂分桶的大小直方图（第 k 个桶为 [2^(k-1), 2^k) 字节，第 0 个桶为空文件）
+        - 基于 SizeSketch 的 p50/p90/p99 等分位数
+        - 按扩展名统计的文件数和字节数
+    多个统计对象可以用 merge 合并。
+    """
+
+    # 过长的“扩展名”（如以点分隔的哈希文件名）归入同一类
+    MAX_EXTENSION_LENGTH = 12
+
+    def __init__(self, relative_accuracy=0.01):
+        self.file_count = 0
+        self.total_size = 0
+        self.max_size = 0
+        self.min_size = 0
+        self.histogram = {}
+        self.sketch = SizeSketch(relative_accuracy)
+        self.extensions = {}
+
+    def add(self, dir_path, name, size):
+        """加入一个文件"""
+        if self.file_count == 0 or size < self.min_size:
+            self.min_size = size
+        if size > self.max_size:
+            self.max_size = size
+        self.file_count += 1
+        self.total_size += size
+
+        bucket = size.bit_length()
+        item = self.histogram.get(bucket)
+        if item is None:
+            item = self.histogram[bucket] = [0, 0]
+        item[0] += 1
+        item[1] += size
+
+        self.sketch.add(size)
+
+        dot = name.rfind('.')
+        ext = name[dot:].lower() if dot > 0 and len(name) - dot <= self.MAX_EXTENSION_LENGTH else ""
+        item = self.extensions.get(ext)
+        if item is None:
+            item = self.extensions[ext] = [0, 0]
+        item[0] += 1
+        item[1] += size
+
+    def merge(self, other):
+        """合并另一个统计对象"""
+        if other.file_count:
+            if self.file_count == 0 or other.min_size < self.min_size:
+                self.min_size = other.min_size
+            self.max_size = max(self.max_size, other.max_size)
+        self.file_count += other.file_count
+        self.total_size += other.total_size
+        for table, other_table in ((self.histogram, other.histogram), (self.extensions, other.extensions)):
+            for key, (count, size) in other_table.items():
+                item = table.setdefault(key, [0, 0])
+                item[0] += count
+                item[1] += size
+        self.sketch.merge(other.sketch)
+
+    def percentiles(self, qs=(0.5, 0.9, 0.99)):
+        """返回 {分位数: 文件大小估计值}"""
+        return {q: self.sketch.quantile(q) for q in qs}
+
+    @staticmethod
+    def bucket_range(bucket):
+        """直方图桶的字节范围 [下限, 上限)"""
+        if bucket == 0:
+            return 0, 1
+        return 1 << (bucket - 1), 1 << bucket
+
+    def top_extensions(self, n=20):
+        """按字节数降序返回 [(扩展名, 文件数, 字节数)]"""
+        return [(ext, count, size) for ext, (count, size) in
+                heapq.nlargest(n, self.extensions.items(), key=lambda item: item[1][1])]
+
+    def to_dict(self):
+        return {
+            "file_count": self.file_count,
+            "total_size": self.total_size,
+            "max_size": self.max_size,
+            "min_size": self.min_size,
+            "percentiles": {f"p{round(q * 100)}": value for q, value in self.percentiles().items()},
+            "histogram": [{"min": self.bucket_range(b)[0], "max": self.bucket_range(b)[1],
+                           "count": count, "bytes": size}
+                          for b, (count, size) in sorted(self.histogram.items())],
+            "extensions": {ext: {"count": count, "bytes": size} for ext, (count, size) in self.extensions.items()},
+        }
+
+
+def display_statistics(stats, top_extensions=15):
+    """显示文件大小分布"""
+    if not stats.file_count:
+        return
+
+    print(f"\n{'=' * 80}")
+    print("文件大小分布:")
+    percentiles = stats.percentiles()
+    print("  " + "  ".join(f"p{round(q * 100)}: {format_file_size(value)}" for q, value in percentiles.items()))
+
+    print(f"\n{'大小区间':<24} {'文件数':>10} {'占比':>7} {'总大小':>12}")
+    print(f"{'-' * 80}")
+    peak = max(count for count, _ in stats.histogram.values())
+    for bucket, (count, size) in sorted(stats.histogram.items()):
+        low, high = stats.bucket_range(bucket)
+        label = "0 B" if bucket == 0 else f"{format_file_size(low)} - {format_file_size(high)}"
+        bar = "#" * max(1, round(count / peak * 20))
+        print(f"{label:<24} {count:>10} {count / stats.file_count:>7.1%} {format_file_size(size):>12}  {bar}")
+
+    print(f"\n按扩展名统计（占用空间最大的 {top_extensions} 类）:")
+    print(f"{'扩展名':<14} {'文件数':>10} {'总大小':>12} {'占比':>7}")
+    print(f"{'-' * 80}")
+    for ext, count, size in stats.top_extensions(top_extensions):
+        share = size / stats.total_size if stats.total_size else 0
+        print(f"{ext or '(无)':<14} {count:>10} {format_file_size(size):>12} {share:>7.1%}")
+
+
+# 重复文件查找中首尾部分哈希读取的字节数
+PARTIAL_HASH_BLOCK = 4096
+
+
+def _partial_file_hash(path, size):
+    """
+    读取文件头尾各 PARTIAL_HASH_BLOCK 字节计算哈希
+
+    Returns:
+        (哈希值, 是否已覆盖整个文件)；读取失败时哈希值为 None
+    """
     try:
-        return os.path.getsize(file_path)
-    except (OSError, IOError, PermissionError):
-        return 0
+        with open(path, 'rb') as f:
+            if size <= 2 * PARTIAL_HASH_BLOCK:
+                return hashlib.blake2b(f.read()).digest(), True
+            h = hashlib.blake2b(f.read(PARTIAL_HASH_BLOCK))
+            f.seek(-PARTIAL_HASH_BLOCK, os.SEEK_END)
+            h.update(f.read(PARTIAL_HASH_BLOCK))
+            return h.digest(), False
+    except OSError:
+        return None, False
+
+
+def _full_file_hash(path):
+    """通过内存映射读取整个文件计算哈希，读取失败时返回 None"""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.blake2b(mm).digest()
+    except (OSError, ValueError):
+        return None
+
+
+def _file_inode(path):
+    """文件的 (设备号, inode 号)，读取失败时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class DuplicateFinder:
+    """
+    基于扫描结果的分阶段重复文件查找
+
+    每一阶段只处理上一阶段留下的候选文件：
+        1. 按文件大小分组，去掉大小唯一的文件；指向同一 inode 的硬链接只保留一个路径，
+           其余记入 hardlinks，不算作重复文件，也不计入可回收空间
+        2. 计算文件头尾各 4 KB 的哈希（线程池并发读取），去掉哈希唯一的文件；
+           不超过 8 KB 的文件在这一步已读完全部内容，不再进入下一阶段
+        3. 通过内存映射计算完整内容哈希，分布到进程池中并行计算
+
+    Args:
+        workers: 线程池和进程池的大小，为 None 时使用 CPU 核数
+        min_size: 参与比较的最小文件大小，默认忽略空文件
+    """
+
+    def __init__(self, workers=None, min_size=1):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_size = max(1, min_size)
+
+        # 各阶段后剩余的候选文件数
+        self.size_candidates = 0
+        self.hardlinks = {}  # 保留的路径 -> 指向同一 inode 的其他路径
+        self.hardlink_count = 0
+        self.partial_candidates = 0
+        self.full_hashed = 0
+        self.error_count = 0
+
+    def find(self, files):
+        """
+        查找重复文件
+
+        Args:
+            files: 可重复迭代的 (路径, 大小) 序列，如 FileTable
+
+        Returns:
+            [(文件大小, [路径, ...])]，按可回收空间降序排列
+        """
+        # 阶段 1：先只统计大小，再只为大小重复的文件收集路径
+        size_counts = Counter(size for _, size in files if size >= self.min_size)
+        by_size = {}
+        for file_path, size in files:
+            if size >= self.min_size and size_counts[size] > 1:
+                by_size.setdefault(size, []).append(file_path)
+        del size_counts
+
+        # 同一 inode 的多个硬链接只保留第一个路径
+        self.hardlinks = {}
+        self.hardlink_count = 0
+        candidates = [path for paths in by_size.values() for path in paths]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            inodes = dict(zip(candidates, pool.map(_file_inode, candidates, chunksize=64)))
+        for size in list(by_size):
+            unique = []
+            first_path = {}
+            for path in by_size[size]:
+                inode = inodes[path]
+                if inode is None:
+                    self.error_count += 1
+                    continue
+                if inode not in first_path:
+                    first_path[inode] = path
+                    unique.append(path)
+                else:
+                    self.hardlinks.setdefault(first_path[inode], []).append(path)
+                    self.hardlink_count += 1
+            if len(unique) > 1:
+                by_size[size] = unique
+            else:
+                del by_size[size]
+        del inodes
+        self.size_candidates = sum(len(paths) for paths in by_size.values())
+
+        # 阶段 2：首尾部分哈希
+        candidates = [(path, size) for size, paths in by_size.items() for path in paths]
+        del by_size
+        by_partial = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            hashes = pool.map(lambda item: _partial_file_hash(*item), candidates, chunksize=64)
+            for (path, size), (digest, complete) in zip(candidates, hashes):
+                if digest is None:
+                    self.error_count += 1
+                    continue
+                by_partial.setdefault((size, digest, complete), []).append(path)
+
+        groups = []
+        full_candidates = []
+        for (size, digest, complete), paths in by_partial.items():
+            if len(paths) < 2:
+                continue
+            if complete:
+                groups.append((size, paths))
+            else:
+                full_candidates.extend((path, size) for path in paths)
+        self.partial_candidates = sum(len(paths) for _, paths in groups) + len(full_candidates)
+        del by_partial
+
+        # 阶段 3：完整内容哈希
+        if full_candidates:
+            by_full = {}
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                hashes = pool.map(_full_file_hash, [path for path, _ in full_candidates], chunksize=16)
+                for (path, size), digest in zip(full_candidates, hashes):
+                    if digest is None:
+                        self.error_count += 1
+                        continue
+                    self.full_hashed += 1
+                    by_full.setdefault((size, digest), []).append(path)
+            groups.extend((size, paths) for (size, _), paths in by_full.items() if len(paths) > 1)
+
+        groups.sort(key=lambda group: group[0] * (len(group[1]) - 1), reverse=True)
+        return groups
+
+
+def display_duplicates(groups, top_n=20, hardlink_count=0):
+    """显示重复文件组和可回收空间，hardlink_count 为未计入的硬链接数"""
+    if hardlink_count:
+        print(f"\n另有 {hardlink_count} 个路径是其他文件的硬链接，不占用额外空间，未计入重复文件")
+    if not groups:
+        print("\n没有找到重复文件")
+        return
+
+    reclaimable = sum(size * (len(paths) - 1) for size, paths in groups)
+    duplicate_count = sum(len(paths) - 1 for _, paths in groups)
+
+    print(f"\n{'=' * 80}")
+    print(f"找到 {len(groups)} 组重复文件，共 {duplicate_count} 个多余副本，"
+          f"可回收空间: {format_file_size(reclaimable)}")
+    print(f"可回收空间最大的 {min(top_n, len(groups))} 组:")
+    print(f"{'-' * 80}")
+
+    for i, (size, paths) in enumerate(groups[:top_n], 1):
+        print(f"{i}. {len(paths)} 个相同文件，每个 {format_file_size(size)}，"
+              f"可回收 {format_file_size(size * (len(paths) - 1))}")
+        for file_path in paths:
+            print(f"       {file_path}")
+
+
+class Inotify:
+    """Linux inotify 的 ctypes 封装"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_ISDIR = 0x40000000
+
+    # 监视目录时关心的事件
+    WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+    _event_header = struct.Struct('iIII')
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify 只在 Linux 上可用")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """监视目录，返回监视描述符"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout=None):
+        """
+        等待并读取事件
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            [(监视描述符, 事件掩码, 名称)]，超时时为空列表
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 1 << 16)
+        events = []
+        header = self._event_header
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = header.unpack_from(data, offset)
+            offset += header.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PathEntry:
+    """为事件中的路径提供 ScanFilter 需要的 DirEntry 接口"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self.path, follow_symlinks=follow_symlinks)
+
+
+class LiveTopFiles:
+    """
+    由 inotify 事件增量维护的内存大小索引和前 N 个最大文件
+
+    初始扫描后按目录保存每个文件的大小，并监视所有目录。事件按批应用：重新取得变化文件的大小，
+    加载新建或移入的目录，删除被删除或移出的目录。前 N 名也是增量更新的：只有当前前 N 名中的文件
+    被删除或变小时才需要全量重算，其余情况只需把本批变化的文件与当前前 N 名合并。
+    可直接交给 display_results 显示（不显示最小文件）。
+
+    Args:
+        root_path: 监视的根目录
+        top_n: 维护的最大文件个数
+        scan_filter: ScanFilter 剪枝规则
+        inotify: Inotify 实例，为 None 时只建立索引不监视
+    """
+
+    def __init__(self, root_path, top_n=50, scan_filter=None, inotify=None):
+        self.root = root_path
+        self.top_n = top_n
+        self.scan_filter = scan_filter
+        self.inotify = inotify
+        self._scanner = FileScanner(root_path, scan_filter=scan_filter)
+        if scan_filter is not None:
+            scan_filter.prepare(root_path)
+
+        self.dirs = {}
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self.top = []
+        self.unwatched_count = 0
+
+        self.file_count = 0
+        self.total_size = 0
+        self.min_size = None
+        self.event_count = 0
+        self.update_count = 0
+
+    @property
+    def max_size(self):
+        return self.top[0][0] if self.top else 0
+
+    def load(self):
+        """初始扫描"""
+        self.load_tree(self.root)
+        self._refresh_top((), full=True)
+
+    def load_tree(self, dir_path):
+        """加载目录树并监视其中所有目录，返回加载的文件 [(目录, 文件名)]"""
+        loaded = []
+        stack = [dir_path]
+        while stack:
+            current = stack.pop()
+            if current in self.dirs:
+                self.remove_tree(current)
+            # 先监视再列出，列出期间发生的变化不会丢失
+            if self.inotify is not None:
+                try:
+                    wd = self.inotify.add_watch(current)
+                    self._wd_to_dir[wd] = current
+                    self._dir_to_wd[current] = wd
+                except OSError as e:
+                    if e.errno == errno.ENOENT:
+                        continue
+                    self.unwatched_count += 1
+            files, subdirs, _ = self._scanner._list_dir(current)
+            if files is None:
+                continue
+            sizes = self.dirs[current] = dict(files)
+            self.file_count += len(sizes)
+            self.total_size += sum(sizes.values())
+            loaded.extend((current, name) for name in sizes)
+            stack.extend(subdirs)
+        return loaded
+
+    def remove_tree(self, dir_path):
+        """从索引中删除目录树并取消监视"""
+        prefix = os.path.join(dir_path, '')
+        for current in [d for d in self.dirs if d == dir_path or d.startswith(prefix)]:
+            sizes = self.dirs.pop(current)
+            self.file_count -= len(sizes)
+            self.total_size -= sum(sizes.values())
+            wd = self._dir_to_wd.pop(current, None)
+            if wd is not None:
+                self._wd_to_dir.pop(wd, None)
+                self.inotify.rm_watch(wd)
+
+    def update_file(self, dir_path, name):
+        """重新取得文件大小，返回是否有变化"""
+        sizes = self.dirs.get(dir_path)
+        if sizes is None:
+            return False
+        old = sizes.get(name)
+        path = os.path.join(dir_path, name)
+        try:
+            st = os.stat(path)
+            # 与扫描一致：目录以外的条目都按文件计
+            new = None if stat.S_ISDIR(st.st_mode) else st.st_size
+        except OSError:
+            new = None
+        if new is not None and self.scan_filter is not None:
+            if not self.scan_filter.accept_file(_PathEntry(path)) or new < self.scan_filter.min_size:
+                new = None
+
+        if new == old:
+            return False
+        if old is not None:
+            self.file_count -= 1
+            self.total_size -= old
+            del sizes[name]
+        if new is not None:
+            self.file_count += 1
+            self.total_size += new
+            sizes[name] = new
+        return True
+
+    def apply_events(self, events):
+        """
+        应用一批 inotify 事件
+
+        Returns:
+            根目录仍然存在时返回 True
+        """
+        self.event_count += len(events)
+        removed_dirs = set()
+        added_dirs = set()
+        dirty = set()
+        overflow = False
+
+        for wd, mask, name in events:
+            if mask & Inotify.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            dir_path = self._wd_to_dir.get(wd)
+            if dir_path is None:
+                continue
+            if mask & Inotify.IN_IGNORED:
+                del self._wd_to_dir[wd]
+                if self._dir_to_wd.get(dir_path) == wd:
+                    del self._dir_to_wd[dir_path]
+                continue
+            if mask & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+                if dir_path == self.root:
+                    return False
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & Inotify.IN_ISDIR:
+                if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                    added_dirs.add(path)
+                elif mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                    removed_dirs.add(path)
+            else:
+                dirty.add((dir_path, name))
+
+        if overflow:
+            # 事件队列溢出，无法得知丢失了哪些变化，只能重新加载
+            self.remove_tree(self.root)
+            self.load()
+            self.update_count += 1
+            return os.path.isdir(self.root)
+
+        candidates = []
+        full = False
+        for dir_path in removed_dirs:
+            self.remove_tree(dir_path)
+        for dir_path in added_dirs:
+            if self.scan_filter is None or self.scan_filter.accept_dir(_PathEntry(dir_path)):
+                candidates.extend(self.load_tree(dir_path))
+        for dir_path, name in dirty:
+            if self.update_file(dir_path, name):
+                candidates.append((dir_path, name))
+
+        self._refresh_top(candidates, full)
+        self.update_count += 1
+        return True
+
+    def _refresh_top(self, candidates, full):
+        if not full:
+            # 当前前 N 名中有文件被删除或变小时，第 N+1 名未知，需要全量重算
+            for size, dir_path, name in self.top:
+                current = self.dirs.get(dir_path, {}).get(name)
+                if current is None or current < size:
+                    full = True
+                    break
+
+        if full:
+            self.top = heapq.nlargest(self.top_n, ((size, dir_path, name)
+                                                   for dir_path, sizes in self.dirs.items()
+                                                   for name, size in sizes.items()))
+            return
+
+        merged = {(dir_path, name): self.dirs[dir_path][name] for _, dir_path, name in self.top}
+        for dir_path, name in candidates:
+            size = self.dirs.get(dir_path, {}).get(name)
+            if size is not None:
+                merged[(dir_path, name)] = size
+        self.top = heapq.nlargest(self.top_n, ((size, dir_path, name) for (dir_path, name), size in merged.items()))
+
+    def items(self):
+        return [(os.path.join(dir_path, name), size) for size, dir_path, name in self.top]
+
+    def __len__(self):
+        return len(self.top)
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+
+def watch_path(target_path, top_n=50, scan_filter=None, debounce=0.2, max_delay=1.0):
+    """
+    监视模式：初始扫描一次，之后根据 inotify 事件就地刷新前 N 个最大文件的表格
 
+    事件会被合并：收到事件后继续等待，直到 debounce 秒内没有新事件或距第一个事件已过 max_delay 秒，
+    再一次性应用整批事件并刷新显示，连续写入不会导致不停地重算。按 Ctrl+C 退出。
+    """
+    target_path = resolve_scan_root(target_path)
+    inotify = Inotify()
+    try:
+        print(f"正在扫描 '{target_path}' 并建立监视...")
+        live = LiveTopFiles(target_path, top_n=top_n, scan_filter=scan_filter, inotify=inotify)
+        live.load()
+
+        def render():
+            # 清屏后重新绘制
+            print("\033[H\033[2J", end="")
+            display_results(live, top_n=top_n)
+            status = f"\n监视中: 最近更新 {time.strftime('%H:%M:%S')}，已处理 {live.event_count} 个事件"
+            if live.unwatched_count:
+                status += f"，{live.unwatched_count} 个目录无法监视（可调大 fs.inotify.max_user_watches）"
+            print(status + "，按 Ctrl+C 退出")
+
+        render()
+        while True:
+            batch = inotify.read_events()
+            started = time.monotonic()
+            while True:
+                remaining = max_delay - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                more = inotify.read_events(min(debounce, remaining))
+                if not more:
+                    break
+                batch.extend(more)
+
+            if not live.apply_events(batch):
+                print(f"\n监视的目录 '{target_path}' 已被删除或移动，停止监视")
+                return
+            render()
+    except KeyboardInterrupt:
+        print("\n停止监视")
+    finally:
+        inotify.close()
+
+
+def print_scan_progress(scanner):
+    """打印扫描进度"""
+    print(f"已扫描 {scanner.file_count} 个文件, {scanner.dir_count} 个目录 "
+          f"({scanner.files_per_second:.0f} 个文件/秒)...")
+
+
+def print_scan_summary(scanner):
+    """打印扫描结果汇总"""
+    print(f"\n扫描完成！用时 {scanner.elapsed:.2f} 秒，平均 {scanner.files_per_second:.0f} 个文件/秒")
+    print(f"总共扫描文件: {scanner.file_count} 个")
+    print(f"无法访问的文件或目录: {scanner.error_count} 个")
+    if scanner.index is not None:
+        print(f"复用索引的目录: {scanner.reused_dir_count} / {scanner.dir_count} 个")
+    if scanner.metrics is not None and scanner.metrics.errors:
+        print("错误分类:")
+        for key, item in sorted(scanner.metrics.errors.items(), key=lambda kv: kv[1]["count"], reverse=True):
+            print(f"  {key}: {item['count']} 个，例如 {item['samples'][0]}")
+
+
+def resolve_scan_root(target_path):
+    """返回实际扫描的目录：路径是文件时扫描其所在目录，路径不存在时抛出 FileNotFoundError"""
+    if not os.path.exists(target_path):
+        raise FileNotFoundError(f"路径 '{target_path}' 不存在")
+    if os.path.isfile(target_path):
+        return os.path.dirname(target_path) or os.curdir
+    return target_path
 
-def scan_path_and_sort_files(target_path):
+
+def iter_files(target_path, workers=1, index_path=None, rescan=False, scan_filter=None):
+    """
+    库接口：在扫描进行中逐条产出 (路径, 大小)，不打印任何内容
+
+    Args:
+        target_path: 要扫描的路径
+        workers: 遍历线程数
+        index_path: 增量扫描索引文件路径
+        rescan: 忽略索引中的缓存记录，强制完整重扫
+        scan_filter: ScanFilter 剪枝规则
+    """
+    index = ScanIndex(index_path) if index_path is not None else None
+    try:
+        yield from FileScanner(resolve_scan_root(target_path), workers=workers, index=index, rescan=rescan,
+                               scan_filter=scan_filter)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def scan_files(target_path, top_n=None, workers=1, index_path=None, rescan=False, sinks=(), progress=None,
+               metrics=None, scan_filter=None):
     """
-    扫描指定路径中的所有最基层文件，并按大小排序
+    库接口：扫描并返回按文件大小降序排列的结果，不打印任何内容
 
     Args:
         target_path: 要扫描的路径，可以是驱动器或文件夹
+        top_n: 只保留最大的 top_n 个文件（内存占用与文件总数无关）；为 None 时保留并排序全部文件
+        workers: 遍历线程数，大于 1 时并发遍历
+        index_path: 增量扫描索引文件路径，为 None 时不使用索引
+        rescan: 忽略索引中的缓存记录，强制完整重扫并刷新索引
+        sinks: 额外的结果接收者（如 DirectoryRollup），每个文件调用 sink.add(目录, 文件名, 大小)，
+            扫描完成后对带有 finish 方法的接收者调用 sink.finish(扫描根目录)
+        progress: 进度回调，见 FileScanner
+        metrics: ScanMetrics，记录耗时、扫描速度和错误明细
+        scan_filter: ScanFilter 剪枝规则，被排除的目录不会被列出
 
     Returns:
-        sorted_files: 按文件大小排序的文件列表
+        (results, scanner)：results 为 FileTable，指定 top_n 时为 TopFiles；
+        scanner 为本次使用的 FileScanner，可从中读取文件数、错误数和用时
+
+    Raises:
+        FileNotFoundError: 路径不存在
     """
-    file_list = []
+    target_path = resolve_scan_root(target_path)
+
+    index = None
+    try:
+        if index_path is not None:
+            index = ScanIndex(index_path)
+        scanner = FileScanner(target_path, workers=workers, progress=progress, index=index, rescan=rescan,
+                              metrics=metrics, scan_filter=scan_filter)
+
+        results = TopFiles(top_n) if top_n is not None else FileTable()
+        adders = [results.add] + [sink.add for sink in sinks]
+        if len(adders) == 1:
+            for dir_path, name, size in scanner.scan_entries():
+                results.add(dir_path, name, size)
+        else:
+            for dir_path, name, size in scanner.scan_entries():
+                for add in adders:
+                    add(dir_path, name, size)
+    finally:
+        if index is not None:
+            index.close()
+
+    for sink in sinks:
+        if hasattr(sink, 'finish'):
+            sink.finish(scanner.target_path)
+
+    if top_n is None:
+        # 按文件大小降序排序（从大到小）
+        if metrics is not None:
+            with metrics.phase('sort'):
+                results.sort_by_size()
+        else:
+            results.sort_by_size()
+    return results, scanner
 
+
+def scan_path_and_sort_files(target_path, workers=1, top_n=None, index_path=None, rescan=False, sinks=(),
+                             metrics=None, scan_filter=None):
+    """
+    扫描指定路径中的所有最基层文件，并按大小排序，同时打印进度和汇总信息
+
+    Args:
+        target_path: 要扫描的路径，可以是驱动器或文件夹
+        其余参数见 scan_files
+
+    Returns:
+        sorted_files: 按文件大小排序的 FileTable；指定 top_n 时为 TopFiles；出错或被中断时为空列表
+    """
     # 检查路径是否存在
     if not os.path.exists(target_path):
         print(f"错误: 路径 '{target_path}' 不存在!")
@@ -30,33 +1707,16 @@ def scan_path_and_sort_files(target_path):
     # 检查是否是文件而非目录
     if os.path.isfile(target_path):
         print(f"注意: '{target_path}' 是一个文件，不是目录。将扫描其所在目录。")
-        target_path = os.path.dirname(target_path)
+        target_path = resolve_scan_root(target_path)
 
     print(f"开始扫描 '{target_path}' ...")
     print("这可能需要一些时间，请耐心等待...\n")
 
-    # 计数器
-    file_count = 0
-    error_count = 0
-
     try:
-        for root, dirs, files in os.walk(target_path):
-            # 处理当前目录下的所有文件（最基层文件）
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_count += 1
-
-                # 每扫描10000个文件显示一次进度
-                if file_count % 10000 == 0:
-                    print(f"已扫描 {file_count} 个文件...")
-
-                try:
-                    file_size = get_file_size(file_path)
-                    file_list.append((file_path, file_size))
-                except Exception:
-                    error_count += 1
-                    continue
-
+        # 每扫描10000个文件显示一次进度和扫描速度
+        sorted_files, scanner = scan_files(target_path, top_n=top_n, workers=workers, index_path=index_path,
+                                           rescan=rescan, sinks=sinks, progress=print_scan_progress,
+                                           metrics=metrics, scan_filter=scan_filter)
     except KeyboardInterrupt:
         print("\n用户中断扫描")
         return []
@@ -64,15 +1724,7 @@ def scan_path_and_sort_files(target_path):
         print(f"扫描过程中出现错误: {e}")
         return []
 
-    print(f"\n扫描完成！")
-    print(f"总共扫描文件: {file_count} 个")
-    print(f"成功获取大小的文件: {len(file_list)} 个")
-    print(f"无法访问的文件: {error_count} 个")
-
-    # 按文件大小降序排序（从大到小）
-    print("\n正在按文件大小排序...")
-    sorted_files = sorted(file_list, key=lambda x: x[1], reverse=True)
-
+    print_scan_summary(scanner)
     return sorted_files
 
 
@@ -107,40 +1759,432 @@ def display_results(sorted_files, top_n=50):
         display_path = file_path if len(file_path) <= 100 else file_path[:67] + "..."
         print(f"{i:<6} {formatted_size:<12} {display_path}")
 
-    # 显示统计信息
-    total_size = sum(size for _, size in sorted_files)
-    avg_size = total_size / len(sorted_files) if sorted_files else 0
+    # 显示统计信息；流式结果自带全部文件的精确统计，不必再遍历
+    if hasattr(sorted_files, 'total_size'):
+        file_count = sorted_files.file_count
+        total_size = sorted_files.total_size
+        max_size, min_size = sorted_files.max_size, sorted_files.min_size
+    else:
+        file_count = len(sorted_files)
+        total_size = sum(size for _, size in sorted_files)
+        max_size, min_size = sorted_files[0][1], sorted_files[-1][1]
+    avg_size = total_size / file_count if file_count else 0
 
     print(f"\n统计信息:")
+    print(f"文件总数: {file_count} 个")
     print(f"总文件大小: {format_file_size(total_size)}")
     print(f"平均文件大小: {format_file_size(avg_size)}")
-    print(f"最大文件: {format_file_size(sorted_files[0][1])}")
-    print(f"最小文件: {format_file_size(sorted_files[-1][1])}")
+    print(f"最大文件: {format_file_size(max_size)}")
+    if min_size is not None:
+        print(f"最小文件: {format_file_size(min_size)}")
+
+
+SNAPSHOT_MAGIC = "#FSZSNAP 2"
+
+
+def _snapshot_path_field(path):
+    # 含换行符或以引号开头的路径按 JSON 字符串写出，其余原样写出
+    if '\n' in path or '\r' in path or path.startswith('"'):
+        return json.dumps(path, ensure_ascii=False)
+    return path
+
+
+def _snapshot_relative(path, root):
+    """快照中记录的路径：相对扫描根目录，分隔符统一为 /，根目录本身为空字符串"""
+    relative = os.path.relpath(path, root)
+    if relative == os.curdir:
+        return ''
+    if os.sep != '/':
+        relative = relative.replace(os.sep, '/')
+    return relative
+
+
+def _snapshot_file_key(relative_path):
+    """文件行的排序键 (所在目录, 文件名)，与 FileTable.iter_by_path 的顺序一致"""
+    dir_path, _, name = relative_path.rpartition('/')
+    return dir_path, name
+
+
+def _open_snapshot(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf-8', errors='surrogateescape', newline='\n')
+    return open(filename, mode, encoding='utf-8', errors='surrogateescape', newline='\n',
+                buffering=1024 * 1024)
 
 
-def save_to_file(sorted_files, target_name, filename=None):
-    """将结果保存到文件"""
+def save_snapshot(filename, files, rollup=None, root=None):
+    """
+    保存扫描快照，供 diff_snapshots 比较
+
+    快照是排好序的文本文件（文件名以 .gz 结尾时 gzip 压缩）：首行为文件头（含扫描根目录），
+    之后先是所有文件行，按 (所在目录, 文件名) 升序排列，再是所有目录行（来自 DirectoryRollup），
+    按路径升序排列。每行为 "类型<TAB>大小<TAB>文件数<TAB>路径"，类型为 F（文件）或 D（目录）。
+    路径相对扫描根目录记录（分隔符为 /，根目录本身为 .），因此以 tree、tree/ 或绝对路径
+    扫描同一目录得到的快照可以互相比较。
+
+    Args:
+        filename: 快照文件路径
+        files: FileTable，或可迭代的 (路径, 大小)
+        rollup: 已完成的 DirectoryRollup，为 None 时快照中不含目录行
+        root: 扫描根目录，为 None 时使用 rollup 的根目录或当前目录
+    """
+    if root is None:
+        root = rollup.root if rollup is not None and rollup.root is not None else os.curdir
+    if hasattr(files, 'iter_by_path'):
+        # 每个目录只计算一次相对路径
+        relative_dirs = {}
+
+        def relative_dir(dir_path):
+            relative = relative_dirs.get(dir_path)
+            if relative is None:
+                relative = relative_dirs[dir_path] = _snapshot_relative(dir_path, root)
+            return relative
+
+        rows = ((relative_dir(dir_path), name, size) for dir_path, name, size in files.iter_by_path(relative_dir))
+    else:
+        rows = sorted((_snapshot_file_key(_snapshot_relative(file_path, root)) + (size,))
+                      for file_path, size in files)
+
+    with _open_snapshot(filename, 'w') as f:
+        f.write(f"{SNAPSHOT_MAGIC}\t{root}\t{time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        chunk = []
+        for dir_path, name, size in rows:
+            file_path = dir_path + '/' + name if dir_path else name
+            chunk.append(f"F\t{size}\t1\t{_snapshot_path_field(file_path)}\n")
+            if len(chunk) >= 10000:
+                f.write("".join(chunk))
+                chunk = []
+        if rollup is not None:
+            dirs = sorted((_snapshot_relative(dir_path, root) or '.', size, count)
+                          for dir_path, size, count in rollup.items())
+            for dir_path, size, count in dirs:
+                chunk.append(f"D\t{size}\t{count}\t{_snapshot_path_field(dir_path)}\n")
+        f.write("".join(chunk))
+
+
+def read_snapshot(filename):
+    """逐行读取快照，产出 (类型, 路径, 大小, 文件数)"""
+    with _open_snapshot(filename, 'r') as f:
+        header = f.readline()
+        if not header.startswith(SNAPSHOT_MAGIC):
+            raise ValueError(f"不是有效的快照文件: {filename}")
+        for line in f:
+            kind, size, count, path = line.rstrip('\n').split('\t', 3)
+            if path.startswith('"'):
+                path = json.loads(path)
+            yield kind, path, int(size), int(count)
+
+
+class SnapshotDiff:
+    """
+    两个快照之间的差异
+
+    对每种类型（F 文件 / D 目录）分别统计新增、删除、增大、缩小的条目数，并各保留字节变化最大的
+    top_n 条。字节变化合计只统计文件：目录大小是累计值，各层目录的变化相互包含，相加会重复计算。
+    """
+
+    CATEGORIES = ('added', 'removed', 'grown', 'shrunk')
+
+    def __init__(self, top_n=20):
+        self.top_n = top_n
+        self.counts = {kind: dict.fromkeys(self.CATEGORIES, 0) for kind in 'FD'}
+        self.bytes = {kind: dict.fromkeys(self.CATEGORIES, 0) for kind in 'FD'}
+        self._heaps = {(kind, category): [] for kind in 'FD' for category in self.CATEGORIES}
+
+    def add(self, kind, category, path, old_size, new_size):
+        delta = new_size - old_size
+        self.counts[kind][category] += 1
+        if kind == 'F':
+            self.bytes[kind][category] += delta
+        heap = self._heaps[(kind, category)]
+        item = (abs(delta), path, old_size, new_size)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def top(self, kind, category):
+        """按字节变化绝对值降序返回 [(路径, 原大小, 新大小, 变化量)]"""
+        return [(path, old, new, new - old)
+                for _, path, old, new in sorted(self._heaps[(kind, category)], reverse=True)]
+
+    def net_change(self):
+        """文件的字节净变化"""
+        return sum(self.bytes['F'].values())
+
+
+def diff_snapshots(old_filename, new_filename, top_n=20):
+    """
+    比较两个快照
+
+    两个快照都已排好序，一次有序归并即可完成比较，内存占用与快照大小无关。
+    路径相对各自的扫描根目录比较，见 save_snapshot。
+
+    Returns:
+        SnapshotDiff
+    """
+    diff = SnapshotDiff(top_n)
+    section = {'F': 0, 'D': 1}
+
+    def keyed(rows):
+        # 文件行按 (所在目录, 文件名) 排序，目录行按路径排序，见 save_snapshot
+        for kind, path, size, _ in rows:
+            key = _snapshot_file_key(path) if kind == 'F' else (path, '')
+            yield (section[kind],) + key, kind, size, path
+
+    old_rows = keyed(read_snapshot(old_filename))
+    new_rows = keyed(read_snapshot(new_filename))
+    old = next(old_rows, None)
+    new = next(new_rows, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            diff.add(old[1], 'removed', old[3], old[2], 0)
+            old = next(old_rows, None)
+        elif old is None or new[0] < old[0]:
+            diff.add(new[1], 'added', new[3], 0, new[2])
+            new = next(new_rows, None)
+        else:
+            if new[2] > old[2]:
+                diff.add(new[1], 'grown', new[3], old[2], new[2])
+            elif new[2] < old[2]:
+                diff.add(new[1], 'shrunk', new[3], old[2], new[2])
+            old = next(old_rows, None)
+            new = next(new_rows, None)
+    return diff
+
+
+def display_snapshot_diff(diff):
+    """显示快照差异"""
+    names = {'added': "新增", 'removed': "删除", 'grown': "增大", 'shrunk': "缩小"}
+    if not any(any(counts.values()) for counts in diff.counts.values()):
+        print("\n两个快照之间没有变化")
+        return
+
+    for kind, kind_name in (('F', "文件"), ('D', "目录")):
+        counts = diff.counts[kind]
+        if not any(counts.values()):
+            continue
+        print(f"\n{'=' * 80}")
+        if kind == 'F':
+            change = diff.net_change()
+            sign = "+" if change >= 0 else "-"
+            print(f"文件变化: 净变化 {sign}{format_file_size(abs(change))}")
+        else:
+            # 目录大小是累计值，各层目录的变化相互包含，不能相加
+            print("目录变化:")
+        for category in SnapshotDiff.CATEGORIES:
+            if not counts[category]:
+                continue
+            if kind == 'F':
+                category_bytes = diff.bytes[kind][category]
+                sign = "+" if category_bytes >= 0 else "-"
+                print(f"\n{names[category]}{kind_name} {counts[category]} 个，"
+                      f"共 {sign}{format_file_size(abs(category_bytes))}:")
+            else:
+                print(f"\n{names[category]}{kind_name} {counts[category]} 个:")
+            for path, old, new, delta in diff.top(kind, category):
+                sign = "+" if delta >= 0 else "-"
+                display_path = path if len(path) <= 100 else path[:67] + "..."
+                print(f"  {sign}{format_file_size(abs(delta)):<12} "
+                      f"{format_file_size(old):>10} -> {format_file_size(new):<10} {display_path}")
+
+
+def display_directory_results(rollup, top_n=20, depth=None):
+    """显示占用空间最大的目录"""
+    top_dirs = rollup.top_dirs(top_n, depth=depth)
+    if not top_dirs:
+        return
+
+    depth_text = "所有层级" if depth is None else f"第 {depth} 层"
+    print(f"\n{'=' * 80}")
+    print(f"{depth_text}占用空间最大的 {top_n} 个目录:")
+    print(f"{'排名':<6} {'累计大小':<12} {'文件数':<10} {'目录路径'}")
+    print(f"{'-' * 80}")
+
+    for i, (dir_path, size, count) in enumerate(top_dirs, 1):
+        display_path = dir_path if len(dir_path) <= 100 else dir_path[:67] + "..."
+        print(f"{i:<6} {format_file_size(size):<12} {count:<10} {display_path}")
+
+
+class ReportWriter:
+    """
+    流式报告写出器
+
+    结果逐条送入，按块格式化后一次性写出，不需要在内存中再保存一份结果。支持的格式：
+        txt   - 可读的排名报告（与原来的 .txt 报告相同）
+        csv   - path,size 两列，大小为精确字节数
+        jsonl - 每行一个 {"path": ..., "size": ...}
+        bin   - 紧凑二进制：文件头 b"FSZR" + 版本号 1 字节，
+                之后每条记录为 <QI（大小、路径字节数）加 UTF-8 路径字节
+    可选 gzip 或 zstd 压缩（zstd 需要安装 zstandard 模块）。
+
+    Args:
+        filename: 输出文件路径
+        fmt: 输出格式，见上
+        compression: None、'gzip' 或 'zstd'
+        title: txt 格式的报告标题
+        chunk_rows: 每块的记录数
+        metrics: ScanMetrics，把格式化和写出的耗时记入“write”阶段
+    """
+
+    FORMATS = ('txt', 'csv', 'jsonl', 'bin')
+    COMPRESSIONS = (None, 'gzip', 'zstd')
+    BIN_MAGIC = b"FSZR\x01"
+    _bin_record = struct.Struct('<QI')
+
+    def __init__(self, filename, fmt='txt', compression=None, title=None, chunk_rows=10000, metrics=None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"不支持的报告格式: {fmt}")
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise RuntimeError("使用 zstd 压缩需要先安装 zstandard 模块 (pip install zstandard)")
+
+        self.filename = filename
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.metrics = metrics
+        self.row_count = 0
+        self._chunk = []
+
+        raw = open(filename, 'wb', buffering=1024 * 1024)
+        if compression == 'gzip':
+            self._file = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+        elif compression == 'zstd':
+            self._file = zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            self._file = raw
+        self._raw = raw
+
+        if fmt == 'txt':
+            self._write_text(f"{title}\n" + "=" * 50 + "\n\n" if title else "")
+        elif fmt == 'csv':
+            self._write_text("path,size\n")
+        elif fmt == 'bin':
+            self._file.write(self.BIN_MAGIC)
+
+    def _write_text(self, text):
+        # surrogateescape 还原无法解码的文件名的原始字节
+        self._file.write(text.encode('utf-8', 'surrogateescape'))
+
+    def write(self, file_path, size):
+        """写入一条记录"""
+        self._chunk.append((file_path, size))
+        if len(self._chunk) >= self.chunk_rows:
+            self.flush()
+
+    def add(self, dir_path, name, size):
+        """以扫描记录的形式写入，可在扫描过程中直接使用"""
+        self.write(os.path.join(dir_path, name), size)
+
+    def write_all(self, files):
+        """写入 (路径, 大小) 序列"""
+        for file_path, size in files:
+            self.write(file_path, size)
+
+    def flush(self):
+        """格式化并写出当前块"""
+        chunk = self._chunk
+        if not chunk:
+            return
+        self._chunk = []
+        began = time.perf_counter()
+
+        if self.fmt == 'txt':
+            start = self.row_count + 1
+            self._write_text("".join(f"{i:4d}. {format_file_size(size):>10} - {file_path}\n"
+                                     for i, (file_path, size) in enumerate(chunk, start)))
+        elif self.fmt == 'csv':
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator='\n').writerows((file_path, size) for file_path, size in chunk)
+            self._write_text(buf.getvalue())
+        elif self.fmt == 'jsonl':
+            dumps = json.dumps
+            self._write_text("".join(dumps({"path": file_path, "size": size}, ensure_ascii=False) + "\n"
+                                     for file_path, size in chunk))
+        else:
+            pack = self._bin_record.pack
+            parts = []
+            for file_path, size in chunk:
+                encoded = file_path.encode('utf-8', 'surrogateescape')
+                parts.append(pack(size, len(encoded)))
+                parts.append(encoded)
+            self._file.write(b"".join(parts))
+
+        self.row_count += len(chunk)
+        if self.metrics is not None:
+            self.metrics.add_time('write', time.perf_counter() - began)
+
+    def close(self):
+        self.flush()
+        began = time.perf_counter()
+        self._file.close()
+        if self._file is not self._raw:
+            self._raw.close()
+        if self.metrics is not None:
+            self.metrics.add_time('write', time.perf_counter() - began)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_binary_report(filename):
+    """读取 bin 格式报告（支持 .gz / .zst 压缩），逐条产出 (路径, 大小)"""
+    if filename.endswith('.gz'):
+        reader = gzip.open(filename, 'rb')
+    elif filename.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩报告需要先安装 zstandard 模块 (pip install zstandard)")
+        reader = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb')),
+                                   buffer_size=1024 * 1024)
+    else:
+        reader = open(filename, 'rb', buffering=1024 * 1024)
+
+    record = ReportWriter._bin_record
+    with reader:
+        if reader.read(len(ReportWriter.BIN_MAGIC)) != ReportWriter.BIN_MAGIC:
+            raise ValueError(f"不是有效的 bin 格式报告: {filename}")
+        while True:
+            header = reader.read(record.size)
+            if len(header) < record.size:
+                break
+            size, length = record.unpack(header)
+            yield reader.read(length).decode('utf-8', 'surrogateescape'), size
+
+
+def save_to_file(sorted_files, target_name, filename=None, fmt='txt', compression=None):
+    """
+    将结果保存到文件
+
+    Args:
+        sorted_files: 可迭代的 (路径, 大小) 结果，按迭代顺序逐块写出
+        target_name: 扫描目标名称
+        filename: 输出文件路径，为 None 时根据目标名称生成
+        fmt: 报告格式 txt / csv / jsonl / bin
+        compression: None、'gzip' 或 'zstd'
+    """
     if filename is None:
         # 创建安全的文件名
         safe_name = "".join(c for c in target_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{safe_name}_文件大小报告.txt"
+        suffix = {None: "", 'gzip': ".gz", 'zstd': ".zst"}.get(compression, "")
+        filename = f"{safe_name}_文件大小报告.{fmt}{suffix}"
 
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"'{target_name}' 文件大小排序报告\n")
-            f.write("=" * 50 + "\n\n")
-
-            for i, (file_path, size) in enumerate(sorted_files, 1):
-                formatted_size = format_file_size(size)
-                f.write(f"{i:4d}. {formatted_size:>10} - {file_path}\n")
+        with ReportWriter(filename, fmt=fmt, compression=compression,
+                          title=f"'{target_name}' 文件大小排序报告") as writer:
+            writer.write_all(sorted_files)
 
         print(f"\n完整结果已保存到: {filename}")
     except Exception as e:
         print(f"保存文件时出错: {e}")
 
 
-def main():
-    """主函数"""
+def interactive_main():
+    """交互式主程序（不带命令行参数运行时使用）"""
     print("文件大小扫描和排序程序")
     print("=" * 50)
     print("提示:")
@@ -159,22 +2203,216 @@ def main():
         target_path = target
         display_name = f"'{target}'"
 
+    # 不需要完整报告时只保留前50个最大的文件，扫描整个驱动器也不会占用大量内存
+    response = input("是否需要完整报告（保存全部文件列表）? (y/n): ").lower()
+    full_report = response in ['y', 'yes']
+
     print(f"\n准备扫描: {display_name}")
 
-    # 扫描文件
-    sorted_files = scan_path_and_sort_files(target_path)
+    # 扫描文件，同时按目录汇总大小
+    rollup = DirectoryRollup()
+    sorted_files = scan_path_and_sort_files(target_path, top_n=None if full_report else 50, sinks=[rollup])
 
     if sorted_files:
         # 显示前50个最大的文件
         display_results(sorted_files, top_n=50)
 
+        # 显示第一层占用空间最大的20个目录
+        display_directory_results(rollup, top_n=20, depth=1)
+
         # 询问是否保存完整结果
-        response = input("\n是否保存完整结果到文件? (y/n): ").lower()
-        if response in ['y', 'yes']:
-            save_to_file(sorted_files, display_name)
+        if full_report:
+            response = input("\n是否保存完整结果到文件? (y/n): ").lower()
+            if response in ['y', 'yes']:
+                save_to_file(sorted_files, display_name)
+
+            # 询问是否查找重复文件
+            response = input("\n是否查找重复文件? (y/n): ").lower()
+            if response in ['y', 'yes']:
+                print("\n正在查找重复文件...")
+                finder = DuplicateFinder()
+                display_duplicates(finder.find(sorted_files), hardlink_count=finder.hardlink_count)
 
     input("\n按回车键退出...")
 
 
+def parse_size(text):
+    """解析带单位的大小，如 "512"、"10K"、"1.5G"（按 1024 进位）"""
+    text = text.strip().upper().rstrip('B')
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+
+
+def build_arg_parser():
+    """命令行参数定义"""
+    parser = argparse.ArgumentParser(
+        description="扫描目录中的所有文件并按大小排序。不带参数运行时进入交互模式。")
+    parser.add_argument("path", nargs="?", help="要扫描的驱动器或文件夹路径")
+    parser.add_argument("-n", "--top", type=int, default=50, help="显示最大的前 N 个文件（默认 50）")
+    parser.add_argument("--full", action="store_true",
+                        help="保留并排序全部文件；否则只在内存中保留前 N 个")
+    parser.add_argument("-o", "--output", help="报告输出文件。指定 --full 时按大小排序写出，"
+                                               "否则在扫描过程中按扫描顺序流式写出全部文件")
+    parser.add_argument("-f", "--format", choices=ReportWriter.FORMATS, default="txt", help="报告格式（默认 txt）")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], help="报告压缩方式")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="遍历线程数（默认 1）")
+    parser.add_argument("--index", help="增量扫描索引文件（SQLite）")
+    parser.add_argument("--rescan", action="store_true", help="忽略索引中的缓存记录，强制完整重扫")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="排除匹配的目录和文件，可重复指定（如 --exclude .git --exclude node_modules）")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="只统计匹配的文件，可重复指定（如 --include '*.log'）")
+    parser.add_argument("--min-size", type=parse_size, default=0, metavar="SIZE",
+                        help="忽略小于该大小的文件，可带单位（如 10M）")
+    parser.add_argument("-x", "--one-file-system", action="store_true", help="不进入其他文件系统（挂载点）")
+    parser.add_argument("--dirs", type=int, default=0, metavar="N", help="同时显示占用空间最大的 N 个目录")
+    parser.add_argument("--depth", type=int, help="目录排名只统计该深度的目录（扫描根目录为 0）")
+    parser.add_argument("--stats", action="store_true", help="显示大小分布直方图、分位数和扩展名统计")
+    parser.add_argument("--stats-json", metavar="FILE", help="把大小分布统计写入 JSON 文件")
+    parser.add_argument("--duplicates", action="store_true", help="查找重复文件（隐含 --full）")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="保存按路径排序的扫描快照（隐含 --full），文件名以 .gz 结尾时压缩")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"),
+                        help="比较两个快照，列出新增、删除、增大和缩小的文件和目录（不进行扫描）")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视模式（仅 Linux）：初始扫描后根据文件系统事件实时刷新前 N 个最大文件")
+    parser.add_argument("--metrics", metavar="FILE", help="运行结束时把耗时、扫描速度和错误明细写入 JSON 文件")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不显示进度和结果表格")
+    return parser
+
+
+def run_cli(args):
+    """
+    非交互式运行，适合计划任务和批处理
+
+    Returns:
+        进程退出码：0 成功，1 出错，130 用户中断
+    """
+    if args.diff:
+        try:
+            display_snapshot_diff(diff_snapshots(args.diff[0], args.diff[1], top_n=args.top))
+        except (OSError, ValueError) as e:
+            print(f"比较快照时出错: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    full = args.full or args.duplicates or bool(args.snapshot)
+    metrics = ScanMetrics() if args.metrics else None
+    scan_filter = None
+    if args.exclude or args.include or args.min_size or args.one_file_system:
+        scan_filter = ScanFilter(exclude=args.exclude, include=args.include, min_size=args.min_size,
+                                 one_file_system=args.one_file_system)
+
+    if args.watch:
+        try:
+            watch_path(args.path, top_n=args.top, scan_filter=scan_filter)
+        except OSError as e:
+            print(f"监视模式出错: {e}", file=sys.stderr)
+            return 1
+        return 0
+    sinks = []
+    rollup = DirectoryRollup() if args.dirs or args.snapshot else None
+    if rollup is not None:
+        sinks.append(rollup)
+    stats = SizeStatistics() if args.stats or args.stats_json else None
+    if stats is not None:
+        sinks.append(stats)
+
+    # 不需要排序时报告在扫描过程中直接写出，不保留全部结果
+    writer = None
+    try:
+        if args.output and not full:
+            writer = ReportWriter(args.output, fmt=args.format, compression=args.compress,
+                                  title=f"'{args.path}' 文件大小报告（扫描顺序）", metrics=metrics)
+            sinks.append(writer)
+
+        results, scanner = scan_files(args.path, top_n=None if full else args.top, workers=args.workers,
+                                      index_path=args.index, rescan=args.rescan, sinks=sinks,
+                                      progress=None if args.quiet else print_scan_progress, metrics=metrics,
+                                      scan_filter=scan_filter)
+    except KeyboardInterrupt:
+        print("\n用户中断扫描", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"扫描过程中出现错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not args.quiet:
+        print_scan_summary(scanner)
+        display_results(results, top_n=args.top)
+        if args.dirs:
+            display_directory_results(rollup, top_n=args.dirs, depth=args.depth)
+        if args.stats:
+            display_statistics(stats)
+
+    if args.stats_json:
+        try:
+            with open(args.stats_json, 'w', encoding='utf-8') as f:
+                json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存统计信息时出错: {e}", file=sys.stderr)
+            return 1
+
+    if args.output and full:
+        try:
+            with ReportWriter(args.output, fmt=args.format, compression=args.compress,
+                              title=f"'{args.path}' 文件大小排序报告", metrics=metrics) as report:
+                report.write_all(results)
+        except Exception as e:
+            print(f"保存文件时出错: {e}", file=sys.stderr)
+            return 1
+    if args.output and not args.quiet:
+        print(f"\n结果已保存到: {args.output}")
+
+    if args.snapshot:
+        try:
+            save_snapshot(args.snapshot, results, rollup=rollup, root=scanner.target_path)
+        except OSError as e:
+            print(f"保存快照时出错: {e}", file=sys.stderr)
+            return 1
+        if not args.quiet:
+            print(f"\n快照已保存到: {args.snapshot}")
+
+    if args.duplicates:
+        finder = DuplicateFinder(workers=args.workers if args.workers > 1 else None)
+        if metrics is not None:
+            with metrics.phase('dedup'):
+                groups = finder.find(results)
+        else:
+            groups = finder.find(results)
+        display_duplicates(groups, hardlink_count=finder.hardlink_count)
+
+    if metrics is not None:
+        try:
+            metrics.save_json(args.metrics)
+        except OSError as e:
+            print(f"保存统计信息时出错: {e}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+def main(argv=None):
+    """主函数：带命令行参数时非交互运行，否则进入交互模式"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        interactive_main()
+        return 0
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.path is None and not args.diff:
+        parser.error("需要指定要扫描的路径")
+    return run_cli(args)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,259 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource  # 仅 Unix：读取进程峰值内存
+except ImportError:
+    resource = None
+
+import 基层文件大小查询排序 as scanner_module
+
+
+# 可测试的扫描模式
+MODES = ('serial', 'parallel', 'topn', 'topn-parallel', 'index-cold', 'index-warm',
+         'report-csv', 'report-bin', 'stats')
+
+
+def tree_dirs(root, fanout, depth):
+    """按层生成目录树中的所有目录路径（包括根目录）"""
+    level = [root]
+    yield root
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                path = os.path.join(parent, f"d{i}")
+                next_level.append(path)
+                yield path
+        level = next_level
+
+
+def sample_size(rng, distribution, mean_size):
+    """按指定分布生成一个文件大小"""
+    if distribution == 'fixed':
+        return mean_size
+    if distribution == 'uniform':
+        return rng.randint(0, 2 * mean_size)
+    # 对数正态：大多数文件很小，少数文件很大，接近真实磁盘
+    return int(rng.lognormvariate(0, 2.0) * mean_size / 7.39)
+
+
+def generate_tree(base_dir, fanout=10, depth=3, files=100000, distribution='lognormal', mean_size=16384,
+                  seed=0):
+    """
+    在 base_dir 下生成可复现的合成目录树
+
+    同样的参数总是生成同样的目录结构和文件大小。文件用 truncate 创建为稀疏文件，
+    几百万个文件也不会占用实际的磁盘空间。参数相同的树已存在时直接复用。
+
+    Returns:
+        (树的根目录, 描述信息字典)
+    """
+    params = {"fanout": fanout, "depth": depth, "files": files, "distribution": distribution,
+              "mean_size": mean_size, "seed": seed}
+    name = "tree_" + "_".join(f"{key}{value}" for key, value in params.items())
+    root = os.path.join(base_dir, name)
+    manifest_path = os.path.join(base_dir, name + ".json")
+
+    if os.path.exists(manifest_path) and os.path.isdir(root):
+        with open(manifest_path, encoding='utf-8') as f:
+            return root, json.load(f)
+
+    if os.path.isdir(root):
+        # 上次生成未完成
+        shutil.rmtree(root)
+
+    rng = random.Random(seed)
+    dirs = list(tree_dirs(root, fanout, depth))
+    total_size = 0
+    for dir_path in dirs:
+        os.makedirs(dir_path, exist_ok=True)
+
+    # 文件按目录轮流分配
+    for i in range(files):
+        dir_path = dirs[i % len(dirs)]
+        size = sample_size(rng, distribution, mean_size)
+        with open(os.path.join(dir_path, f"f{i}.dat"), 'wb') as f:
+            if size:
+                f.truncate(size)
+        total_size += size
+        if (i + 1) % 100000 == 0:
+            print(f"已生成 {i + 1} / {files} 个文件...")
+
+    info = dict(params, dirs=len(dirs), total_size=total_size)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    return root, info
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（字节），平台不支持时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_mode(mode, root, workers, work_dir):
+    """
+    在当前进程中运行一种扫描模式，返回测量结果
+
+    各阶段耗时来自 ScanMetrics；index-warm 模式先建立索引，只计量第二次扫描；
+    report 模式完整扫描并排序后写出全部结果。
+    """
+    metrics = scanner_module.ScanMetrics()
+    top_n = 50 if mode.startswith('topn') else None
+    mode_workers = workers if mode.endswith('parallel') else 1
+    index_path = None
+    sinks = []
+    writer = None
+
+    if mode.startswith('index'):
+        index_path = os.path.join(work_dir, "bench_index.db")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        top_n = 50
+        if mode == 'index-warm':
+            scanner_module.scan_files(root, top_n=top_n, index_path=index_path)
+    elif mode.startswith('report'):
+        fmt = mode.split('-', 1)[1]
+        writer = scanner_module.ReportWriter(os.path.join(work_dir, f"bench_report.{fmt}"), fmt=fmt,
+                                             metrics=metrics)
+    elif mode == 'stats':
+        sinks.append(scanner_module.SizeStatistics())
+        top_n = 50
+
+    start = time.perf_counter()
+    results, scanner = scanner_module.scan_files(root, top_n=top_n, workers=mode_workers, index_path=index_path,
+                                                 sinks=sinks, metrics=metrics)
+    if writer is not None:
+        # 报告模式：完整扫描、排序后写出全部结果
+        writer.write_all(results)
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "workers": mode_workers,
+        "elapsed": elapsed,
+        "files": scanner.file_count,
+        "dirs": scanner.dir_count,
+        "errors": scanner.error_count,
+        "files_per_sec": scanner.file_count / elapsed if elapsed > 0 else 0.0,
+        "phases": metrics.phases,
+        "throughput": metrics.to_dict()["throughput"],
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def _mode_worker(mode, root, workers, work_dir, result_queue):
+    try:
+        result_queue.put(run_mode(mode, root, workers, work_dir))
+    except Exception as e:
+        result_queue.put({"mode": mode, "error": str(e)})
+
+
+def run_isolated(mode, root, workers, work_dir, timeout=None):
+    """
+    在独立子进程中运行一种模式，使峰值内存只反映该模式本身
+
+    子进程异常退出（段错误、被系统因内存不足终止等）或超过 timeout 秒未完成时，
+    返回带 error 的结果而不是一直等待。
+    """
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_mode_worker, args=(mode, root, workers, work_dir, result_queue))
+    process.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    result = None
+    while result is None:
+        try:
+            result = result_queue.get(timeout=1.0)
+        except queue.Empty:
+            if not process.is_alive():
+                # 子进程可能在退出前刚好放入结果
+                try:
+                    result = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    result = {"mode": mode, "error": f"子进程异常退出，退出码 {process.exitcode}"}
+            elif deadline is not None and time.monotonic() > deadline:
+                process.terminate()
+                result = {"mode": mode, "error": f"超过 {timeout} 秒未完成，已终止"}
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="文件大小扫描程序的基准测试：生成合成目录树并测量各扫描模式")
+    parser.add_argument("--base-dir", default=os.path.join(tempfile.gettempdir(), "filesize_bench"),
+                        help="合成目录树的存放位置（默认在系统临时目录下，可复用）")
+    parser.add_argument("--fanout", type=int, default=10, help="每个目录的子目录数（默认 10）")
+    parser.add_argument("--depth", type=int, default=3, help="目录层数（默认 3）")
+    parser.add_argument("--files", type=int, default=100000, help="文件总数（默认 100000）")
+    parser.add_argument("--distribution", choices=["lognormal", "uniform", "fixed"], default="lognormal",
+                        help="文件大小分布（默认 lognormal）")
+    parser.add_argument("--mean-size", type=int, default=16384, help="平均文件大小（字节，默认 16384）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（默认 0）")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="要测试的扫描模式")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 4, help="并发模式的线程数")
+    parser.add_argument("--repeat", type=int, default=1, help="每种模式的重复次数")
+    parser.add_argument("--timeout", type=float, default=None, help="每次运行的最长时间（秒，默认不限制）")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 文件")
+    parser.add_argument("--label", default="", help="记录在结果中的版本标签，便于跨版本对比")
+    parser.add_argument("--cleanup", action="store_true", help="测试结束后删除合成目录树")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.base_dir, exist_ok=True)
+    print("正在准备合成目录树...")
+    root, tree_info = generate_tree(args.base_dir, fanout=args.fanout, depth=args.depth, files=args.files,
+                                    distribution=args.distribution, mean_size=args.mean_size, seed=args.seed)
+    print(f"目录树: {root} ({tree_info['files']} 个文件, {tree_info['dirs']} 个目录)")
+
+    work_dir = tempfile.mkdtemp(prefix="filesize_bench_work_")
+    results = []
+    try:
+        for mode in args.modes:
+            for i in range(args.repeat):
+                result = run_isolated(mode, root, args.workers, work_dir, timeout=args.timeout)
+                result["run"] = i + 1
+                results.append(result)
+                if "error" in result:
+                    print(f"{mode:<14} 出错: {result['error']}")
+                    continue
+                rss = result["peak_rss_bytes"]
+                rss_text = scanner_module.format_file_size(rss) if rss is not None else "-"
+                print(f"{mode:<14} 第 {i + 1} 次: {result['elapsed']:8.3f} 秒 "
+                      f"{result['files_per_sec']:>10.0f} 个文件/秒  峰值内存 {rss_text}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if args.cleanup:
+            shutil.rmtree(root, ignore_errors=True)
+            os.remove(os.path.join(args.base_dir, os.path.basename(root) + ".json"))
+
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tree": tree_info,
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())